@@ -30,28 +30,31 @@ const saveAudioToFile = async (audioBuffer, mimeType) => {
 };
 
 /**
- * 调用 Whisper 服务进行语音转录
+ * 调用 Whisper 服务转录一段实时录音，走 interactive 队列，不会排在文件转录之后
  * @param {string} filePath - 音频文件的路径
  * @param {string} language - 音频语言
+ * @param {string} [sessionId] - 客户端 ID，Whisper 服务据此在会话间公平调度
  * @returns {Promise<object>} 转录结果
  */
-const transcribeAudio = async (filePath, language) => {
+const transcribeAudio = async (filePath, language, sessionId) => {
   const form = new FormData();
-  form.append('audio', fs.createReadStream(filePath));
+  form.append('file', fs.createReadStream(filePath));
   form.append('language', language);
+  // 实时字幕使用单次贪心解码，不走温度回退
+  form.append('profile', 'realtime');
+  if (sessionId) {
+    form.append('session_id', sessionId);
+  }
 
   logger.info(`正在调用 Whisper 服务进行转录: ${filePath}`);
-  const response = await retryRequest(`${WHISPER_URL}/transcribe`, {
+  const response = await retryRequest(`${WHISPER_URL}/transcribe_realtime`, {
     method: 'POST',
     data: form,
     headers: form.getHeaders(),
     timeout: 90000, // 90秒超时
   });
 
-  if (!response.data.success) {
-    throw new Error(`Whisper 服务错误: ${response.data.error}`);
-  }
-  return response.data.result;
+  return response.data;
 };
 
 /**
@@ -59,9 +62,10 @@ const transcribeAudio = async (filePath, language) => {
  * @param {string} text - 要翻译的文本
  * @param {string} source_lang - 源语言
  * @param {string} target_lang - 目标语言
+ * @param {string} [session_id] - 客户端 ID，翻译服务据此在会话间公平调度
  * @returns {Promise<object>} 翻译结果
  */
-const translateText = async (text, source_lang, target_lang) => {
+const translateText = async (text, source_lang, target_lang, session_id) => {
   logger.info(`正在调用翻译服务: [${source_lang} -> ${target_lang}] \"${text}\"`);
   const response = await retryRequest(`${TRANSLATOR_URL}/translate`, {
     method: 'POST',
@@ -69,6 +73,7 @@ const translateText = async (text, source_lang, target_lang) => {
       text,
       source_lang,
       target_lang,
+      session_id,
     },
     timeout: 30000, // 30秒超时
   });
@@ -14,7 +14,12 @@ async function retryRequest(url, options = {}, maxRetries = 3) {
       return response;
     } catch (error) {
       logger.warn(`Request attempt ${attempt} failed: ${error.message}`);
-      
+
+      // 429 表示该会话在途请求已满，重试只会继续占用队列，直接交给调用方丢弃
+      if (error.response && error.response.status === 429) {
+        throw error;
+      }
+
       if (attempt === maxRetries) {
         logger.error(`All ${maxRetries} attempts failed for ${url}`);
         throw error;
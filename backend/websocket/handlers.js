@@ -92,6 +92,7 @@ function handleConnection(socket) {
 
   // 监听 'audio_chunk' 事件
   socket.on('audio_chunk', async (data) => {
+    let tempFilePath;
     try {
       // 从 data 对象中解构出所需字段
       const { audio, language, target_lang, sessionId, mimeType } = data;
@@ -102,10 +103,15 @@ function handleConnection(socket) {
       }
 
       // 1. 将音频数据保存到临时文件
-      const tempFilePath = await saveAudioToFile(audio, mimeType);
+      tempFilePath = await saveAudioToFile(audio, mimeType);
 
       // 2. 调用 Whisper 服务进行转录
-      const transcriptionResult = await transcribeAudio(tempFilePath, language);
+      const transcriptionResult = await transcribeAudio(tempFilePath, language, socket.id);
+      if (transcriptionResult.coalesced) {
+        // 该片段已并入同一会话稍后的片段，文本由后者返回
+        logger.info(`[${socket.id}] 音频块已合并到后续请求，跳过`);
+        return;
+      }
       logger.info(`[${socket.id}] Whisper 转录完成: ${transcriptionResult.text}`);
 
       // 3. 将转录结果发回客户端
@@ -122,7 +128,8 @@ function handleConnection(socket) {
         const translationResult = await translateText(
           transcriptionResult.text,
           transcriptionResult.language,
-          target_lang
+          target_lang,
+          socket.id
         );
         logger.info(`[${socket.id}] 翻译完成: ${translationResult.translated_text}`);
 
@@ -135,20 +142,37 @@ function handleConnection(socket) {
         });
       }
 
-      // 6. 清理临时文件
-      await fs.promises.unlink(tempFilePath);
-
     } catch (error) {
+      if (isSessionLimitError(error)) {
+        logger.warn(`[${socket.id}] 会话在途请求已满，丢弃该音频块`);
+        return;
+      }
       logger.error(`[${socket.id}] 处理音频块时出错: ${error.message}`);
       socket.emit('error', { 
         message: '处理音频失败', 
         details: error.message,
         sessionId: data.sessionId // 即使失败也返回 sessionId
       });
+    } finally {
+      // 6. 清理临时文件（包括被合并、被 429 丢弃和出错的音频块）
+      if (tempFilePath) {
+        try {
+          await fs.promises.unlink(tempFilePath);
+        } catch (cleanupError) {
+          logger.warn(`[${socket.id}] 清理临时文件失败: ${cleanupError.message}`);
+        }
+      }
     }
   });
 }
 
+/**
+ * 推理服务因会话在途请求超限返回 429，实时音频直接丢弃即可
+ */
+function isSessionLimitError(error) {
+  return Boolean(error.response && error.response.status === 429);
+}
+
 /**
  * 处理音频转录
  */
@@ -169,7 +193,11 @@ async function handleAudioTranscribe(socket, data) {
 
   try {
     tempFilePath = await saveAudioToFile(audioBuffer, audioFormat || 'audio/webm');
-    const transcriptionResult = await transcribeAudio(tempFilePath, language);
+    const transcriptionResult = await transcribeAudio(tempFilePath, language, socket.id);
+    if (transcriptionResult.coalesced) {
+      logger.info(`${logPrefix} Audio was coalesced into a later chunk, skipping.`);
+      return;
+    }
     logger.info(`${logPrefix} Received transcription: "${transcriptionResult.text}"`);
 
     // 发送转录结果
@@ -187,7 +215,8 @@ async function handleAudioTranscribe(socket, data) {
         const translationResult = await translateText(
             transcriptionResult.text,
             transcriptionResult.language || language || 'auto',
-            targetLanguage
+            targetLanguage,
+            socket.id
         );
         logger.info(`${logPrefix} Translation completed: "${translationResult.translated_text}"`);
         socket.emit('translation_result', {
@@ -199,6 +228,10 @@ async function handleAudioTranscribe(socket, data) {
     }
 
   } catch (error) {
+    if (isSessionLimitError(error)) {
+      logger.warn(`${logPrefix} Session has too many requests in flight, dropping audio.`);
+      return;
+    }
     logger.error(`${logPrefix} ERROR during transcription process:`, error.message);
     socket.emit('transcription_result', {
       sessionId,
@@ -231,7 +264,7 @@ async function handleTranslateRequest(socket, data) {
   logger.info(`Processing translation for session ${sessionId}: "${text}" (${source_lang} -> ${target_lang})`);
   
   try {
-    const translationResult = await translateText(text, source_lang, target_lang);
+    const translationResult = await translateText(text, source_lang, target_lang, socket.id);
     // 将翻译结果发回客户端
     socket.emit('translation_result', {
         success: true,
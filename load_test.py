@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+实时字幕负载 / 浸泡测试工具
+
+模拟 N 个并发直播会话：每个会话按 MediaRecorder 的节奏定时切出音频片段，
+按后端的请求格式（webm/opus 片段、profile=realtime）发送到 Whisper 服务的 /transcribe_realtime，
+再把识别文本发送到翻译服务的 /translate。端点和表单字段可以通过参数调整。
+按时间窗口记录每个会话的端到端延迟、丢弃率和服务饱和度（调度队列深度），
+浸泡测试结束后根据内存、临时文件和缓存的增长趋势判断是否存在泄漏。
+
+只依赖标准库；--stub 模式会在本地启动模拟延迟的桩服务，不需要模型和网络。
+
+用法:
+    python load_test.py --sessions 20 --duration 600
+    python load_test.py --stub --sessions 50 --duration 120
+    python load_test.py --sessions 10 --duration 14400 --sample-interval 60 --output soak.json
+    python load_test.py --whisper-endpoint /transcribe --field realtime=true --field profile=balanced
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import statistics
+import struct
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_RATE = 16000
+
+# --- 音频准备 ---
+
+def load_pcm(path):
+    """用 ffmpeg 把音频文件解码为 16kHz 单声道 s16le，失败时返回 None"""
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', path,
+             '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 's16le', 'pipe:1'],
+            capture_output=True, check=True
+        )
+        return result.stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"⚠️ 无法解码 {path}: {e}")
+        return None
+
+def synthetic_pcm(seconds):
+    """生成带噪声的正弦波，作为离线模式的音频源"""
+    rng = random.Random(0)
+    samples = []
+    for i in range(int(seconds * SAMPLE_RATE)):
+        value = 0.3 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE) + rng.uniform(-0.05, 0.05)
+        samples.append(int(value * 32767))
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+# 片段格式 -> (文件名, Content-Type)
+CHUNK_FORMATS = {
+    "webm": ("chunk.webm", "audio/webm"),
+    "wav": ("chunk.wav", "audio/wav"),
+}
+
+def encode_webm(wav_data):
+    """用 ffmpeg 把 WAV 片段编码成与浏览器 MediaRecorder 相同的 webm/opus，失败时返回 None"""
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+             '-c:a', 'libopus', '-b:a', '16k', '-f', 'webm', 'pipe:1'],
+            input=wav_data, capture_output=True, check=True
+        )
+        return result.stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def make_chunks(pcm, chunk_seconds, chunk_format):
+    """把 PCM 切成定长片段，每个片段封装成独立的音频文件；无法编码 webm 时退回 WAV"""
+    chunk_bytes = int(chunk_seconds * SAMPLE_RATE) * 2
+    chunks = []
+    for offset in range(0, len(pcm) - chunk_bytes + 1, chunk_bytes):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(pcm[offset:offset + chunk_bytes])
+        chunks.append(buffer.getvalue())
+
+    if chunk_format == "webm":
+        encoded = [encode_webm(chunk) for chunk in chunks]
+        if all(encoded):
+            return encoded, chunk_format
+        print("⚠️ ffmpeg 无法编码 webm/opus，改用 WAV 片段，结果会比真实流量乐观")
+    return chunks, "wav"
+
+# --- HTTP ---
+
+def encode_multipart(fields, filename, content, content_type='audio/wav'):
+    """构造 multipart/form-data 请求体"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+        )
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8')
+    )
+    parts.append(content)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def http_request(url, body=None, content_type=None, timeout=30):
+    """发送请求，返回 (状态码, JSON)；网络错误和超时返回状态码 0"""
+    headers = {'Content-Type': content_type} if content_type else {}
+    request = urllib.request.Request(url, data=body, headers=headers, method='POST' if body is not None else 'GET')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, OSError, ValueError):
+        return 0, None
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# --- 统计 ---
+
+class Stats:
+    """线程安全的计数器，按采样窗口和整个测试分别汇总"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {"sent": 0, "completed": 0, "dropped": 0, "client_dropped": 0, "coalesced": 0}
+        self.lags = []
+        self.session_lags = {}
+        self.window = self._empty_window()
+
+    @staticmethod
+    def _empty_window():
+        return {"sent": 0, "completed": 0, "dropped": 0, "client_dropped": 0, "coalesced": 0, "lags": []}
+
+    def add(self, key, session_id=None, lag=None):
+        with self.lock:
+            self.totals[key] += 1
+            self.window[key] += 1
+            if lag is not None:
+                self.lags.append(lag)
+                self.window["lags"].append(lag)
+                self.session_lags.setdefault(session_id, []).append(lag)
+
+    def take_window(self):
+        with self.lock:
+            window, self.window = self.window, self._empty_window()
+        return window
+
+# --- 会话 ---
+
+class LiveSession(threading.Thread):
+    """
+    一个直播会话：每 chunk_seconds 秒产生一个片段并立即异步发送，不等待上一个片段完成，
+    与浏览器 MediaRecorder 的行为一致；服务跟不上时延迟会持续增长。
+    """
+
+    def __init__(self, index, args, chunks, executor, stats, stop_event):
+        super().__init__(daemon=True)
+        self.session_id = f"load-{index}-{uuid.uuid4().hex[:6]}"
+        self.args = args
+        self.chunks = chunks
+        self.executor = executor
+        self.stats = stats
+        self.stop_event = stop_event
+        self.pending = 0
+        self.pending_lock = threading.Lock()
+        self.offset = random.randrange(len(chunks))
+
+    def run(self):
+        next_emit = time.monotonic() + self.args.chunk_seconds
+        sequence = 0
+        while not self.stop_event.is_set():
+            delay = next_emit - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            emitted_at = time.monotonic()
+            next_emit += self.args.chunk_seconds
+
+            with self.pending_lock:
+                if self.pending >= self.args.max_pending:
+                    self.stats.add("client_dropped")
+                    continue
+                self.pending += 1
+            chunk = self.chunks[(self.offset + sequence) % len(self.chunks)]
+            sequence += 1
+            self.stats.add("sent")
+            self.executor.submit(self.process_chunk, chunk, emitted_at)
+
+    def process_chunk(self, chunk, emitted_at):
+        try:
+            filename, audio_type = CHUNK_FORMATS[self.args.chunk_format]
+            body, content_type = encode_multipart(
+                {"language": self.args.language, "session_id": self.session_id, **self.args.fields},
+                filename, chunk, audio_type
+            )
+            status, result = http_request(
+                f"{self.args.whisper_url}{self.args.whisper_endpoint}", body, content_type, self.args.timeout
+            )
+            if status != 200 or result is None:
+                self.stats.add("dropped")
+                return
+            # /transcribe 把结果包在 {"success": ..., "result": ...} 中
+            if "result" in result:
+                result = result["result"]
+            if result.get("coalesced"):
+                self.stats.add("coalesced")
+                return
+
+            text = result.get("text", "").strip()
+            source_lang = result.get("language", "en")
+            if text and self.args.target_lang and source_lang != self.args.target_lang:
+                payload = json.dumps({
+                    "text": text,
+                    "source_lang": source_lang,
+                    "target_lang": self.args.target_lang,
+                    "session_id": self.session_id,
+                }).encode('utf-8')
+                status, _ = http_request(
+                    f"{self.args.translator_url}/translate", payload, 'application/json', self.args.timeout
+                )
+                if status != 200:
+                    self.stats.add("dropped")
+                    return
+
+            self.stats.add("completed", self.session_id, time.monotonic() - emitted_at)
+        finally:
+            with self.pending_lock:
+                self.pending -= 1
+
+# --- 监控 ---
+
+def poll_service(url):
+    """读取服务 /metrics 中的调度和进程指标"""
+    status, metrics = http_request(f"{url}/metrics", timeout=5)
+    if status != 200 or not metrics:
+        return None
+    scheduler = metrics.get("scheduler", {})
+    process = metrics.get("process", {})
+    return {
+        "queued": sum(stats.get("queued", 0) for stats in scheduler.values()),
+        "running": sum(stats.get("running", 0) for stats in scheduler.values()),
+        "rss_mb": process.get("rss_mb"),
+        "temp_files": process.get("temp_files"),
+        "cache_size": process.get("cache_size"),
+    }
+
+def sample(stats, args, started_at, timeseries):
+    """汇总一个采样窗口并打印一行"""
+    window = stats.take_window()
+    lags = window["lags"]
+    point = {
+        "elapsed_s": round(time.monotonic() - started_at, 1),
+        "sent": window["sent"],
+        "completed": window["completed"],
+        "dropped": window["dropped"],
+        "client_dropped": window["client_dropped"],
+        "coalesced": window["coalesced"],
+        "lag_p50_s": percentile(lags, 0.5),
+        "lag_p95_s": percentile(lags, 0.95),
+        "whisper": poll_service(args.whisper_url),
+        "translator": poll_service(args.translator_url),
+    }
+    timeseries.append(point)
+
+    def fmt(value):
+        return f"{value:.2f}" if value is not None else "-"
+
+    def service(info):
+        if not info:
+            return "n/a"
+        return f"q={info['queued']} run={info['running']} rss={fmt(info['rss_mb'])}MB tmp={info['temp_files']}"
+
+    print(f"[{point['elapsed_s']:>7}s] sent={point['sent']} ok={point['completed']} "
+          f"drop={point['dropped'] + point['client_dropped']} coalesced={point['coalesced']} "
+          f"lag p50={fmt(point['lag_p50_s'])}s p95={fmt(point['lag_p95_s'])}s | "
+          f"whisper {service(point['whisper'])} | translator {service(point['translator'])}")
+
+# --- 泄漏检测 ---
+
+def slope_per_hour(points):
+    """最小二乘斜率，单位为每小时"""
+    if len(points) < 3:
+        return None
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if not denominator:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator * 3600
+
+def detect_leaks(timeseries, args):
+    """跳过预热阶段后，检查内存、临时文件和缓存是否持续增长"""
+    steady = timeseries[int(len(timeseries) * args.warmup_fraction):]
+    findings = []
+    for service in ("whisper", "translator"):
+        for key, threshold, unit in (
+            ("rss_mb", args.leak_threshold_mb_per_hour, "MB/h"),
+            ("temp_files", args.leak_threshold_files_per_hour, "files/h"),
+            ("cache_size", None, "entries/h"),
+        ):
+            points = [(p["elapsed_s"], p[service][key]) for p in steady if p[service] and p[service].get(key) is not None]
+            slope = slope_per_hour(points)
+            if slope is None:
+                continue
+            # 缓存有容量上限，只报告增长趋势，不判定为泄漏
+            leaking = threshold is not None and slope > threshold
+            findings.append({"service": service, "metric": key, "slope": round(slope, 2), "unit": unit, "leak": leaking})
+    return findings
+
+# --- 桩服务 ---
+
+class StubState:
+    """模拟单工作线程推理：请求串行执行，耗时与音频时长 / 文本长度成正比"""
+
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.counter_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+
+    def run(self, seconds):
+        with self.counter_lock:
+            self.queued += 1
+        with self.lock:
+            with self.counter_lock:
+                self.queued -= 1
+                self.running += 1
+            time.sleep(seconds)
+            with self.counter_lock:
+                self.running -= 1
+
+def make_stub_handler(kind, state):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def respond(self, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.respond({"status": "ready", "service": f"stub-{kind}"})
+            elif self.path == '/metrics':
+                self.respond({
+                    "scheduler": {"interactive": {"queued": state.queued, "running": state.running}},
+                    "process": {"rss_mb": None, "temp_files": 0},
+                })
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if kind == 'whisper' and self.path == state.args.whisper_endpoint:
+                state.run(state.args.chunk_seconds * state.args.stub_rtf)
+                self.respond({"text": "stub transcription", "language": "en", "profile": "realtime", "coalesced": False})
+            elif kind == 'translator' and self.path == '/translate':
+                text = json.loads(body).get("text", "")
+                state.run(state.args.stub_mt_seconds + 0.002 * len(text))
+                self.respond({"success": True, "result": {"translated_text": "桩翻译", "superseded": False}})
+            else:
+                self.send_error(404)
+
+    return StubHandler
+
+def start_stub(kind, args):
+    """在随机端口启动桩服务，返回其 URL"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_stub_handler(kind, StubState(args)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+# --- 主流程 ---
+
+def wait_until_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, _ = http_request(f"{url}/health", timeout=5)
+        if status == 200:
+            return True
+        time.sleep(2)
+    return False
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="实时字幕负载 / 浸泡测试")
+    parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--duration", type=float, default=120, help="测试时长（秒）")
+    parser.add_argument("--ramp-up", type=float, default=10, help="所有会话启动完成所需的时间（秒）")
+    parser.add_argument("--chunk-seconds", type=float, default=2.0, help="每个片段的时长，即发送间隔")
+    parser.add_argument("--max-pending", type=int, default=8, help="每个会话客户端侧最多在途的片段数，超出则丢弃")
+    parser.add_argument("--timeout", type=float, default=60, help="单个请求超时（秒）")
+    parser.add_argument("--whisper-url", default="http://localhost:8001")
+    parser.add_argument("--translator-url", default="http://localhost:8002")
+    parser.add_argument("--language", default="auto")
+    parser.add_argument("--target-lang", default="zh")
+    parser.add_argument("--audio", default="test.mp3", help="用作音频源的文件，无法解码时改用合成音频")
+    parser.add_argument("--chunk-format", choices=sorted(CHUNK_FORMATS), default="webm",
+                        help="片段的封装格式，默认与浏览器 MediaRecorder 一致的 webm/opus")
+    parser.add_argument("--whisper-endpoint", default="/transcribe_realtime", help="识别端点，默认与后端一致")
+    parser.add_argument("--field", action="append", default=[], metavar="KEY=VALUE",
+                        help="附加到识别请求的表单字段，可重复；默认 profile=realtime，与后端一致")
+    parser.add_argument("--sample-interval", type=float, default=10, help="采样间隔（秒）")
+    parser.add_argument("--warmup-fraction", type=float, default=0.2, help="泄漏检测时跳过的前段比例")
+    parser.add_argument("--leak-threshold-mb-per-hour", type=float, default=50)
+    parser.add_argument("--leak-threshold-files-per-hour", type=float, default=10)
+    parser.add_argument("--output", help="把时间序列和汇总写入 JSON 文件")
+    parser.add_argument("--stub", action="store_true", help="启动本地桩服务代替真实模型，离线运行")
+    parser.add_argument("--stub-rtf", type=float, default=0.15, help="桩识别服务的实时率（耗时 / 音频时长）")
+    parser.add_argument("--stub-mt-seconds", type=float, default=0.03, help="桩翻译服务的基础耗时")
+    args = parser.parse_args()
+    args.fields = {"profile": "realtime"}
+    for field in args.field:
+        key, separator, value = field.partition("=")
+        if not separator:
+            parser.error(f"--field expects KEY=VALUE, got: {field}")
+        args.fields[key] = value
+    return args
+
+def main():
+    args = parse_args()
+
+    if args.stub:
+        args.whisper_url = start_stub('whisper', args)
+        args.translator_url = start_stub('translator', args)
+        print(f"🧪 桩服务已启动: whisper={args.whisper_url} translator={args.translator_url}")
+
+    pcm = load_pcm(args.audio) if os.path.exists(args.audio) else None
+    if not pcm:
+        print("使用合成音频作为音频源")
+        pcm = synthetic_pcm(max(30.0, args.chunk_seconds * 4))
+    chunks, args.chunk_format = make_chunks(pcm, args.chunk_seconds, args.chunk_format)
+    print(f"音频源切分为 {len(chunks)} 个 {args.chunk_seconds}s {args.chunk_format} 片段，"
+          f"发送到 {args.whisper_endpoint}，附加字段 {args.fields}")
+
+    for url in (args.whisper_url, args.translator_url):
+        if not wait_until_ready(url, 600):
+            print(f"❌ 服务未就绪: {url}")
+            return
+
+    stats = Stats()
+    stop_event = threading.Event()
+    timeseries = []
+    executor = ThreadPoolExecutor(max_workers=args.sessions * args.max_pending)
+    sessions = [LiveSession(i, args, chunks, executor, stats, stop_event) for i in range(args.sessions)]
+
+    print(f"=== 开始负载测试: {args.sessions} 个会话, {args.duration}s ===")
+    started_at = time.monotonic()
+    for i, session in enumerate(sessions):
+        session.start()
+        if args.ramp_up and i < len(sessions) - 1:
+            time.sleep(args.ramp_up / len(sessions))
+
+    try:
+        while time.monotonic() - started_at < args.duration:
+            time.sleep(min(args.sample_interval, max(0.0, args.duration - (time.monotonic() - started_at))))
+            sample(stats, args, started_at, timeseries)
+    except KeyboardInterrupt:
+        print("收到中断，提前结束")
+    stop_event.set()
+    for session in sessions:
+        session.join()
+    executor.shutdown(wait=True)
+    sample(stats, args, started_at, timeseries)
+
+    totals = stats.totals
+    lost = totals["dropped"] + totals["client_dropped"]
+    session_p95 = [percentile(lags, 0.95) for lags in stats.session_lags.values()]
+    summary = {
+        **totals,
+        "drop_rate": round(lost / totals["sent"], 4) if totals["sent"] else 0.0,
+        "lag_p50_s": percentile(stats.lags, 0.5),
+        "lag_p95_s": percentile(stats.lags, 0.95),
+        "lag_p99_s": percentile(stats.lags, 0.99),
+        "worst_session_lag_p95_s": max(session_p95) if session_p95 else None,
+        "leaks": detect_leaks(timeseries, args),
+    }
+
+    print("\n=== 汇总 ===")
+    print(json.dumps({k: v for k, v in summary.items() if k != "leaks"}, indent=2, ensure_ascii=False))
+    for finding in summary["leaks"]:
+        marker = "❌ 疑似泄漏" if finding["leak"] else "✅"
+        print(f"{marker} {finding['service']}.{finding['metric']}: {finding['slope']} {finding['unit']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "summary": summary, "timeseries": timeseries}, f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()
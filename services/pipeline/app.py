@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import importlib.util
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+import uvicorn
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 同进程加载 whisper 和 translator 两个服务的代码，音频和文本在各阶段之间直接在内存中传递
+SERVICES_DIR = os.getenv("SERVICES_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))
+# 与两个服务相同的性能分析开关；流水线以 NDJSON 流式返回，X-Trace 的耗时分解放在最后的 done 行中
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+
+def load_module(name: str, path: str):
+    """按文件路径加载模块"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def register_helper(module_name: str, directory: str):
+    """
+    按路径加载服务目录中的辅助模块，并以裸模块名注册，供 app.py 中的 `from scheduler import ...` 使用。
+    两个服务都带有 scheduler.py / profiling.py：同名模块已注册时两份文件必须完全一致并共用同一个实例
+    （profiling 的 contextvar 才能贯穿识别和翻译），否则拒绝启动，而不是静默运行另一个服务的副本。
+    """
+    path = os.path.join(SERVICES_DIR, directory, f"{module_name}.py")
+    existing = sys.modules.get(module_name)
+    if existing is None:
+        sys.modules[module_name] = load_module(module_name, path)
+        return
+    with open(existing.__file__, "rb") as f:
+        existing_source = f.read()
+    with open(path, "rb") as f:
+        if f.read() != existing_source:
+            raise RuntimeError(f"{path} differs from {existing.__file__}; the pipeline shares one copy between services")
+
+def load_service(name: str, directory: str, helpers):
+    """按文件路径加载服务模块及其辅助模块，两个服务的 app.py 同名，不能直接 import"""
+    for module_name in helpers:
+        register_helper(module_name, directory)
+    return load_module(name, os.path.join(SERVICES_DIR, directory, "app.py"))
+
+# 两个服务各自保留独立的调度器实例和执行器，识别和翻译可以并行执行
+asr = load_service("asr_service", "whisper", ("scheduler", "profiling"))
+mt = load_service("mt_service", "translator", ("scheduler", "profiling", "glossary"))
+# 与两个服务共用同一个 profiling 模块，请求级 trace 才能贯穿解码、识别和翻译各阶段
+profiling = asr.profiling
+
+pipeline_metrics = {"requests": 0, "no_speech": 0, "total_ms": 0.0}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    asr.load_glossaries()
+    mt.load_glossaries()
+    # 两个服务的模型互不依赖，并发加载
+    startup_tasks = [asyncio.create_task(asr.start_model()), asyncio.create_task(mt.start_models())]
+    yield
+    for task in startup_tasks:
+        task.cancel()
+
+# 创建 FastAPI 应用
+app = FastAPI(title="Speech Translation Pipeline Service", lifespan=lifespan)
+
+# 配置 CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+def is_ready() -> bool:
+    return asr.startup_status["ready"] and mt.startup_status["ready"]
+
+@app.get("/health")
+async def health_check():
+    """健康检查端点，识别和翻译模型都加载并预热完成前返回 503"""
+    content = {
+        "status": "ready" if is_ready() else "loading",
+        "whisper": asr.startup_status,
+        "translator": mt.startup_status,
+        "service": "pipeline"
+    }
+    if not is_ready():
+        return JSONResponse(status_code=503, content=content)
+    return content
+
+@app.get("/metrics")
+async def get_metrics():
+    """流水线整体耗时以及两个阶段各自的指标"""
+    requests = pipeline_metrics["requests"]
+    return {
+        "service": "pipeline",
+        "pipeline": {
+            "requests": requests,
+            "no_speech": pipeline_metrics["no_speech"],
+            "avg_ms": round(pipeline_metrics["total_ms"] / requests, 2) if requests else 0.0,
+        },
+        "whisper": await asr.get_metrics(),
+        "translator": await mt.get_metrics(),
+    }
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    """采样 seconds 秒内识别和翻译所有线程的调用栈，返回折叠栈文本，需要设置 PROFILING_ENABLED=true"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled. Set PROFILING_ENABLED=true to enable it.")
+    if not 0 < seconds <= asr.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {asr.PROFILE_MAX_SECONDS}]")
+    loop = asyncio.get_running_loop()
+    stacks = await loop.run_in_executor(None, profiling.sample_stacks, seconds)
+    return PlainTextResponse(stacks)
+
+def _line(payload: dict) -> str:
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+async def translate_part(part: dict, target_lang: str, profile: str, priority: str, session_id: str, tenant: str):
+    """翻译一个识别窗口的文本，与识别使用同一个调度类别"""
+    request = mt.TranslationRequest(
+        text=part["text"],
+        source_lang=part["language"],
+        target_lang=target_lang,
+        profile=profile,
+        session_id=session_id,
+        tenant=tenant
+    )
+    try:
+        result = await mt.run_translation(request, priority)
+        return {"type": "translation", "segment_id": part["segment_id"], **result}
+    except HTTPException as e:
+        return {"type": "translation", "segment_id": part["segment_id"], "error": e.detail, "status_code": e.status_code}
+
+def _done_line(speech: bool, start_time: float, trace) -> str:
+    done = {"type": "done", "speech": speech, "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 2)}
+    if trace is not None:
+        done["trace"] = trace.as_dict()
+    return _line(done)
+
+async def run_pipeline(speech, language: str, target_lang: str, profile: str, priority: str, session_id: str, tenant: str, start_time: float, trace=None):
+    """
+    逐窗口识别并立即开始翻译，以 NDJSON 流式返回：
+    每个窗口先返回一行 transcription，翻译完成后按窗口顺序返回 translation，最后返回 done。
+    """
+    pending = []
+    try:
+        parts = asr.iter_transcription(speech, language, profile, priority, session_id, asr.get_glossary_prompt(tenant))
+        async for part in parts:
+            yield _line({"type": "transcription", **part})
+            if part["text"].strip() and part["language"] != target_lang:
+                # 翻译在翻译服务的执行器中运行，与下一个窗口的识别重叠
+                pending.append(asyncio.create_task(translate_part(part, target_lang, profile, priority, session_id, tenant)))
+            while pending and pending[0].done():
+                yield _line(pending.pop(0).result())
+        for task in pending:
+            yield _line(await task)
+        pending = []
+    except HTTPException as e:
+        yield _line({"type": "error", "error": e.detail, "status_code": e.status_code})
+    except Exception as e:
+        logger.error(f"Pipeline error: {e}")
+        yield _line({"type": "error", "error": str(e), "status_code": 500})
+    finally:
+        for task in pending:
+            task.cancel()
+
+    pipeline_metrics["requests"] += 1
+    pipeline_metrics["total_ms"] += (time.perf_counter() - start_time) * 1000
+    yield _done_line(True, start_time, trace)
+
+@app.post("/pipeline")
+async def pipeline(
+    request: Request,
+    file: UploadFile = File(...),
+    target_lang: str = Form(...),
+    language: str = Form("auto"),
+    profile: str = Form("realtime"), # 识别和翻译共用的解码档位
+    realtime: str = Form("true"), # 实时录音流（webm 片段）走 interactive 队列
+    session_id: str = Form(None),
+    tenant: str = Form(None)
+):
+    """
+    音频 -> 解码 -> VAD -> Whisper -> Marian 一次完成，中间结果不落盘、不经过 HTTP。
+    返回 NDJSON 流，识别结果和翻译结果在各自完成时立即返回。
+    """
+    start_time = time.perf_counter()
+    trace = None
+    if PROFILING_ENABLED and request.headers.get("X-Trace"):
+        # 不需要重置：请求结束时所在任务的上下文随之丢弃，流式响应和翻译任务会继承这个上下文
+        trace, _ = profiling.start_trace()
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Pipeline models are not ready yet.")
+
+    asr.validate_profile(profile)
+    if profile not in mt.DECODING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown decoding profile: {profile}")
+
+    data = await file.read()
+    if len(data) < 100:
+        raise HTTPException(status_code=400, detail="Audio data is too small to be valid.")
+
+    session_id = asr.get_session_id(session_id, request)
+    is_realtime = realtime.lower() == 'true'
+    logger.info(f"Pipeline request. Size: {len(data)}, Language: {language} -> {target_lang}, Profile: {profile}, Session: {session_id}")
+
+    # ffmpeg 解码和 VAD 都是阻塞调用，放到默认执行器中，避免阻塞事件循环
+    loop = asyncio.get_running_loop()
+    with profiling.span("audio_decode"):
+        audio_np = await loop.run_in_executor(None, asr.load_audio_bytes, data, is_realtime)
+    if audio_np is None:
+        raise HTTPException(status_code=400, detail="Audio conversion failed.")
+    speech = audio_np
+    if VAD_ENABLED:
+        with profiling.span("vad"):
+            speech = await loop.run_in_executor(None, asr.trim_silence, audio_np, VAD_AGGRESSIVENESS)
+
+    if len(speech) == 0:
+        pipeline_metrics["no_speech"] += 1
+        logger.info("No speech detected, skipping recognition and translation.")
+        return StreamingResponse(iter([_done_line(False, start_time, trace)]), media_type="application/x-ndjson")
+
+    priority = "interactive" if is_realtime else "bulk"
+    return StreamingResponse(
+        run_pipeline(speech, language, target_lang, profile, priority, session_id, tenant, start_time, trace),
+        media_type="application/x-ndjson"
+    )
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=False,
+        log_level="info"
+    )
@@ -1,16 +1,25 @@
 import os
-from typing import Dict, List
-from fastapi import FastAPI, HTTPException
+import json
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import uvicorn
 import logging
-from transformers import MarianMTModel, MarianTokenizer
 from cachetools import TTLCache
-import torch
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
-import functools
+from scheduler import PriorityScheduler, SessionLimitExceeded
+from glossary import Glossary
+import profiling
+
+# transformers / torch 导入较慢，延迟到后台加载模型时再导入，让 HTTP 服务先启动
+STARTUP_BEGIN = time.perf_counter()
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -33,24 +42,161 @@ class TranslationRequest(BaseModel):
     text: str
     source_lang: str
     target_lang: str
+    profile: str = "realtime"
+    session_id: Optional[str] = None  # 会话 / 客户端 ID，用于会话间公平调度
+    tenant: Optional[str] = None  # 租户 ID，用于选择术语表
+    segment_id: Optional[str] = None  # 推测翻译的片段 ID，同一片段的新修订会中止旧修订
+    revision: int = 0
 
 class TranslationResponse(BaseModel):
     translated_text: str
     source_lang: str
     target_lang: str
     confidence: float
+    profile: str = "realtime"
+    glossary_version: Optional[str] = None
+    superseded: bool = False
+
+class GlossaryTerm(BaseModel):
+    term: str
+    translations: Dict[str, str] = {}  # 目标语言 -> 译文，未指定的语言保持原文
+
+class GlossaryRequest(BaseModel):
+    terms: List[GlossaryTerm]
 
 # 全局变量
 models: Dict[str, Dict] = {}
 translation_cache = TTLCache(maxsize=1000, ttl=3600)  # 1小时缓存
 
-def _translate_blocking(model, tokenizer, text, **kwargs):
+# 解码配置档位：realtime 单束贪心解码，accurate 使用更宽的束搜索
+# max_new_tokens = 输入 token 数 * length_ratio + length_margin
+DECODING_PROFILES = {
+    "realtime": {
+        "num_beams": 1,
+        "early_stopping": False,
+        "length_ratio": 1.5,
+        "length_margin": 8,
+    },
+    "balanced": {
+        "num_beams": 2,
+        "early_stopping": True,
+        "length_ratio": 2.0,
+        "length_margin": 10,
+    },
+    "accurate": {
+        "num_beams": 4,
+        "early_stopping": True,
+        "length_ratio": 3.0,
+        "length_margin": 16,
+    },
+}
+
+# 预热配置：启动后用示例句子（重复不同次数模拟常见长度）跑一遍每个模型
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_REPEATS = [int(n) for n in os.getenv("WARMUP_REPEATS", "1,4").split(",") if n.strip()]
+WARMUP_PROFILES = [p.strip() for p in os.getenv("WARMUP_PROFILES", ",".join(DECODING_PROFILES)).split(",") if p.strip() in DECODING_PROFILES]
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() == "true"
+WARMUP_TEXTS = {
+    "ja": "こんにちは、今日の会議を始めましょう。",
+    "en": "Hello, let's start today's meeting.",
+    "zh": "你好，我们开始今天的会议吧。",
+}
+
+MODEL_DIR = os.getenv("MODEL_DIR", "/app/models")
+# 首次启动时把模型另存为 safetensors，之后直接从本地目录 mmap 加载
+MMAP_WEIGHTS = os.getenv("MMAP_WEIGHTS", "true").lower() == "true"
+
+# 启动状态，/health 只有在模型加载并预热完成后才返回 ready
+startup_status = {
+    "stage": "loading",
+    "ready": False,
+    "load_ms": None,
+    "warmup_ms": None,
+    "time_to_healthy_ms": None,
+}
+
+# 租户术语表，更新时编译一次 Aho-Corasick 自动机，并持久化到 GLOSSARY_DIR
+GLOSSARY_DIR = os.getenv("GLOSSARY_DIR", "/app/glossaries")
+glossaries: Dict[str, Glossary] = {}
+
+# 推测翻译：每个 (session_id, segment_id) 只保留最新修订，旧修订排队时直接跳过、生成中通过 stopping criteria 中止。
+# 供会反复提交同一片段增长中文本的客户端使用；当前后端每个实时片段只翻译一次最终文本，不携带 segment_id
+active_segments: Dict[Tuple[Optional[str], str], Tuple[int, threading.Event]] = {}
+speculation_metrics = {"superseded": 0}
+
+# 推理调度：/translate 走 interactive 队列，/translate_batch 逐条走 bulk 队列，交互请求可在两条之间插队
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# 每个会话（客户端）最多同时在途的请求数，超出时返回 429
+MAX_INFLIGHT_PER_SESSION = int(os.getenv("MAX_INFLIGHT_PER_SESSION", "4"))
+scheduler = PriorityScheduler(max_workers=INFERENCE_WORKERS, max_inflight_per_session=MAX_INFLIGHT_PER_SESSION)
+
+# 性能分析（默认关闭）：开启后提供 /debug/profile 采样接口，并为带 X-Trace 请求头的请求返回耗时分解；
+# 不带请求头的请求只多一次 contextvar 读取，可以在生产环境常开
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+if PROFILING_ENABLED:
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        """带 X-Trace 请求头的请求在响应头 X-Trace 中返回各阶段耗时（毫秒，xN 表示累计 N 次）"""
+        if not request.headers.get("X-Trace"):
+            return await call_next(request)
+        trace, token = profiling.start_trace()
+        try:
+            with profiling.span("total"):
+                response = await call_next(request)
+        finally:
+            profiling.end_trace(token)
+        response.headers["X-Trace"] = trace.header()
+        return response
+
+# 按档位统计的请求数和耗时
+profile_metrics = {name: {"requests": 0, "total_ms": 0.0, "max_ms": 0.0} for name in DECODING_PROFILES}
+
+def build_generate_kwargs(profile: str, input_length: int) -> Dict:
+    """根据解码档位和输入长度构建 generate 参数"""
+    settings = DECODING_PROFILES[profile]
+    return {
+        "num_beams": settings["num_beams"],
+        "do_sample": False,
+        "early_stopping": settings["early_stopping"],
+        "max_new_tokens": int(input_length * settings["length_ratio"]) + settings["length_margin"],
+    }
+
+def record_profile_metrics(profile: str, elapsed_ms: float):
+    """记录解码档位的耗时统计"""
+    stats = profile_metrics[profile]
+    stats["requests"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+def _translate_blocking(model, tokenizer, text, profile="realtime", cancel_event=None):
     """
     在独立的执行器中运行阻塞的翻译函数。
+    cancel_event 被设置时跳过或中止生成，返回 None。
     """
-    logger.info("Starting translation in executor...")
-    translated_tokens = model.generate(**tokenizer(text, return_tensors="pt", padding=True).to(model.device), **kwargs)
-    result = tokenizer.decode(translated_tokens[0], skip_special_tokens=True)
+    if cancel_event is not None and cancel_event.is_set():
+        logger.info("Translation superseded before it started, skipping.")
+        return None
+
+    logger.info(f"Starting translation in executor with profile '{profile}'...")
+    with profiling.span("tokenize"):
+        inputs = tokenizer(text, return_tensors="pt", padding=True).to(model.device)
+    generate_kwargs = build_generate_kwargs(profile, inputs["input_ids"].shape[-1])
+    if cancel_event is not None:
+        from transformers import StoppingCriteriaList
+
+        # 每生成一步检查一次，新修订到达后在当前步结束时停止
+        generate_kwargs["stopping_criteria"] = StoppingCriteriaList([
+            lambda input_ids, scores, **kwargs: cancel_event.is_set()
+        ])
+    with profiling.span("generate"):
+        translated_tokens = model.generate(**inputs, **generate_kwargs)
+    if cancel_event is not None and cancel_event.is_set():
+        logger.info("Translation superseded during generation, aborted.")
+        return None
+    with profiling.span("detokenize"):
+        result = tokenizer.decode(translated_tokens[0], skip_special_tokens=True)
     logger.info("Translation finished in executor.")
     return result
 
@@ -62,53 +208,219 @@ SUPPORTED_MODELS = {
     "zh-en": "Helsinki-NLP/opus-mt-zh-en"
 }
 
+def _load_direction(direction: str, model_name: str):
+    """加载单个翻译方向的分词器和模型，torch / transformers 已由 load_translation_models 导入"""
+    import torch
+    from transformers import MarianMTModel, MarianTokenizer
+
+    local_dir = os.path.join(MODEL_DIR, "safetensors", direction)
+    if MMAP_WEIGHTS and os.path.exists(os.path.join(local_dir, "model.safetensors")):
+        logger.info(f"Loading model: {model_name} from {local_dir}")
+        tokenizer = MarianTokenizer.from_pretrained(local_dir)
+        # low_cpu_mem_usage 跳过随机初始化，直接使用 safetensors 的 mmap 权重，而不是先初始化再整份拷贝
+        model = MarianMTModel.from_pretrained(local_dir, low_cpu_mem_usage=True)
+    else:
+        logger.info(f"Loading model: {model_name}")
+        tokenizer = MarianTokenizer.from_pretrained(model_name, cache_dir=MODEL_DIR)
+        model = MarianMTModel.from_pretrained(model_name, cache_dir=MODEL_DIR)
+        if MMAP_WEIGHTS:
+            logger.info(f"Converting model {direction} to safetensors at {local_dir}")
+            # 先写临时目录再替换，避免中途退出留下不完整的 model.safetensors 被下次启动当作可用权重
+            tmp_dir = f"{local_dir}.tmp"
+            try:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                model.save_pretrained(tmp_dir, safe_serialization=True)
+                tokenizer.save_pretrained(tmp_dir)
+                shutil.rmtree(local_dir, ignore_errors=True)
+                os.replace(tmp_dir, local_dir)
+            except Exception as e:
+                # MODEL_DIR 只读或空间不足时照常使用已加载的模型
+                logger.warning(f"Failed to save safetensors weights for {direction}, serving the in-memory model: {e}")
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # M2 芯片优化
+    if torch.backends.mps.is_available():
+        model = model.to("mps")
+        logger.info(f"Model {direction} loaded on MPS")
+    else:
+        model = model.to("cpu")
+        logger.info(f"Model {direction} loaded on CPU")
+
+    return {
+        "tokenizer": tokenizer,
+        "model": model
+    }
+
 def load_translation_models():
-    """加载翻译模型"""
+    """并发加载各翻译方向的模型"""
     global models
     
     logger.info("Loading translation models...")
+
+    # transformers 的延迟模块导入不是线程安全的，先在当前线程完成首次导入，再并发加载各方向
+    import torch  # noqa: F401
+    from transformers import MarianMTModel, MarianTokenizer  # noqa: F401
+
+    with ThreadPoolExecutor(max_workers=len(SUPPORTED_MODELS)) as executor:
+        futures = {
+            direction: executor.submit(_load_direction, direction, model_name)
+            for direction, model_name in SUPPORTED_MODELS.items()
+        }
+        for direction, future in futures.items():
+            try:
+                models[direction] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to load model {SUPPORTED_MODELS[direction]}: {e}")
+                continue
     
-    for direction, model_name in SUPPORTED_MODELS.items():
+    logger.info(f"Successfully loaded {len(models)} translation models")
+
+def compile_translation_models():
+    """可选：用 torch.compile 编译各模型的编码器，失败时退回 eager 模式"""
+    import torch
+
+    for direction, entry in models.items():
         try:
-            logger.info(f"Loading model: {model_name}")
-            
-            # 加载分词器和模型
-            tokenizer = MarianTokenizer.from_pretrained(model_name, cache_dir="/app/models")
-            model = MarianMTModel.from_pretrained(model_name, cache_dir="/app/models")
-            
-            # M2 芯片优化
-            if torch.backends.mps.is_available():
-                model = model.to("mps")
-                logger.info(f"Model {direction} loaded on MPS")
-            else:
-                model = model.to("cpu")
-                logger.info(f"Model {direction} loaded on CPU")
-            
-            models[direction] = {
-                "tokenizer": tokenizer,
-                "model": model
-            }
-            
+            model = entry["model"]
+            model.model.encoder = torch.compile(model.model.encoder)
+            logger.info(f"Encoder of model {direction} compiled")
         except Exception as e:
-            logger.error(f"Failed to load model {model_name}: {e}")
+            logger.warning(f"torch.compile failed for {direction}, falling back to eager mode: {e}")
+
+def _warmup_blocking():
+    """
+    对每个已加载的模型按常见长度和每个解码档位执行一次翻译，
+    提前完成分词器初始化、内存分配器扩容和算子选择。
+    """
+    for direction, entry in models.items():
+        source_lang = direction.split("-")[0]
+        sample = WARMUP_TEXTS.get(source_lang, WARMUP_TEXTS["en"])
+        for repeats in WARMUP_REPEATS:
+            text = " ".join([sample] * repeats)
+            for profile in WARMUP_PROFILES:
+                start_time = time.perf_counter()
+                _translate_blocking(entry["model"], entry["tokenizer"], text, profile)
+                logger.info(f"Warm-up {direction} x{repeats}/{profile} took {(time.perf_counter() - start_time) * 1000:.0f} ms")
+
+async def start_models():
+    """在后台加载并预热模型，完成后将服务标记为 ready"""
+    loop = asyncio.get_running_loop()
+
+    start_time = time.perf_counter()
+    await loop.run_in_executor(None, load_translation_models)
+    if not models:
+        startup_status["stage"] = "failed"
+        return
+    if TORCH_COMPILE:
+        compile_translation_models()
+    startup_status["load_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+
+    startup_status["stage"] = "warming_up"
+    start_time = time.perf_counter()
+    if WARMUP_ENABLED:
+        logger.info(f"Warming up translation models: {list(models.keys())}")
+        try:
+            await loop.run_in_executor(None, _warmup_blocking)
+        except Exception as e:
+            logger.warning(f"Warm-up failed, serving without it: {e}")
+    startup_status["warmup_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+
+    startup_status["time_to_healthy_ms"] = round((time.perf_counter() - STARTUP_BEGIN) * 1000, 2)
+    startup_status["stage"] = "ready"
+    startup_status["ready"] = True
+    logger.info(f"Translation service ready in {startup_status['time_to_healthy_ms']} ms "
+                f"(load {startup_status['load_ms']} ms, warm-up {startup_status['warmup_ms']} ms)")
+
+def load_glossaries():
+    """从 GLOSSARY_DIR 加载已保存的租户术语表"""
+    if not os.path.isdir(GLOSSARY_DIR):
+        return
+    for filename in os.listdir(GLOSSARY_DIR):
+        if not filename.endswith(".json"):
             continue
-    
-    logger.info(f"Successfully loaded {len(models)} translation models")
+        tenant = filename[:-len(".json")]
+        try:
+            with open(os.path.join(GLOSSARY_DIR, filename), encoding="utf-8") as f:
+                glossaries[tenant] = Glossary(tenant, json.load(f))
+            logger.info(f"Loaded glossary for tenant {tenant}: {len(glossaries[tenant].terms)} terms")
+        except Exception as e:
+            logger.error(f"Failed to load glossary {filename}: {e}")
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时加载模型"""
-    load_translation_models()
+    """应用启动时加载术语表，并在后台加载并预热模型，/health 在此期间可以响应"""
+    load_glossaries()
+    asyncio.create_task(start_models())
 
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    return {
-        "status": "healthy",
+    """健康检查端点，模型加载并预热完成前返回 503"""
+    ready = bool(models) and startup_status["ready"]
+    content = {
+        "status": startup_status["stage"],
         "loaded_models": list(models.keys()),
         "cache_size": len(translation_cache),
+        "load_ms": startup_status["load_ms"],
+        "warmup_ms": startup_status["warmup_ms"],
+        "time_to_healthy_ms": startup_status["time_to_healthy_ms"],
         "service": "translator"
     }
+    if not ready:
+        return JSONResponse(status_code=503, content=content)
+    return content
+
+def get_process_stats():
+    """进程常驻内存和临时文件数量，供长时间压测检测泄漏"""
+    rss_mb = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 2)
+    except (OSError, ValueError):
+        pass
+    return {
+        "rss_mb": rss_mb,
+        "temp_files": len(os.listdir(tempfile.gettempdir())),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """按解码档位汇总的翻译耗时"""
+    return {
+        "service": "translator",
+        "profiles": {
+            name: {
+                "requests": stats["requests"],
+                "avg_ms": round(stats["total_ms"] / stats["requests"], 2) if stats["requests"] else 0.0,
+                "max_ms": round(stats["max_ms"], 2),
+            }
+            for name, stats in profile_metrics.items()
+        },
+        "speculation": {
+            "active_segments": len(active_segments),
+            "superseded": speculation_metrics["superseded"],
+        },
+        "scheduler": scheduler.snapshot(),
+        "process": {
+            **get_process_stats(),
+            "cache_size": len(translation_cache),
+            "glossaries": len(glossaries),
+        }
+    }
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    """
+    采样 seconds 秒内所有线程的调用栈，返回折叠栈文本，可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+    需要设置 PROFILING_ENABLED=true。
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled. Set PROFILING_ENABLED=true to enable it.")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}]")
+    # 采样线程放在默认执行器中，不占用推理工作线程
+    loop = asyncio.get_running_loop()
+    stacks = await loop.run_in_executor(None, profiling.sample_stacks, seconds)
+    return PlainTextResponse(stacks)
 
 @app.get("/supported_languages")
 async def get_supported_languages():
@@ -135,24 +447,62 @@ def get_model_direction(source_lang: str, target_lang: str) -> str:
     
     raise ValueError(f"Unsupported translation direction: {source_lang} -> {target_lang}")
 
-@app.post("/translate")
-async def translate_text(request: TranslationRequest):
+def superseded_result(request: TranslationRequest) -> Dict:
+    """被同一片段的新修订取代时返回的结果，不写入缓存"""
+    speculation_metrics["superseded"] += 1
+    logger.info(f"Translation of segment {request.segment_id} revision {request.revision} superseded")
+    return TranslationResponse(
+        translated_text="",
+        source_lang=request.source_lang,
+        target_lang=request.target_lang,
+        confidence=0.0,
+        profile=request.profile,
+        superseded=True
+    ).dict()
+
+async def run_translation(request: TranslationRequest, priority: str) -> Dict:
     """
-    翻译文本接口
+    通过调度器执行一次翻译
     
     Args:
         request: 包含待翻译文本和语言方向的请求
+        priority: 调度类别，interactive 或 bulk
     
     Returns:
-        翻译结果
+        翻译结果字典
     """
+    segment_key = None
+    cancel_event = None
     try:
-        # 检查缓存
-        cache_key = f"{request.text}_{request.source_lang}_{request.target_lang}"
+        if request.profile not in DECODING_PROFILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown decoding profile: {request.profile}. Available: {list(DECODING_PROFILES.keys())}"
+            )
+        
+        # 推测翻译：登记为该片段的最新修订，并中止仍在进行的旧修订。
+        # 必须在检查缓存之前完成，否则命中缓存的新修订不会中止旧修订，旧修订会返回过期的译文
+        if request.segment_id is not None:
+            current = active_segments.get((request.session_id, request.segment_id))
+            if current is not None and current[0] > request.revision:
+                return superseded_result(request)
+            if current is not None:
+                current[1].set()
+            segment_key = (request.session_id, request.segment_id)
+            cancel_event = threading.Event()
+            active_segments[segment_key] = (request.revision, cancel_event)
+        
+        # 检查缓存（不同档位、不同版本的术语表结果可能不同）
+        glossary = glossaries.get(request.tenant) if request.tenant else None
+        glossary_version = glossary.version if glossary else None
+        cache_key = f"{request.text}_{request.source_lang}_{request.target_lang}_{request.profile}_{glossary_version}"
         if cache_key in translation_cache:
             logger.info("Cache hit for translation")
             cached_result = translation_cache[cache_key]
-            return JSONResponse(content={"success": True, "result": cached_result.dict()})
+            return cached_result.dict()
+        
+        if not startup_status["ready"]:
+            raise HTTPException(status_code=503, detail="Translation models are not loaded yet.")
         
         # 获取对应的模型
         direction = get_model_direction(request.source_lang, request.target_lang)
@@ -173,10 +523,28 @@ async def translate_text(request: TranslationRequest):
         
         logger.info(f"Translating: '{text}' ({request.source_lang} -> {request.target_lang})")
         
+        # 术语保护：翻译前替换为占位符，翻译后换回术语译文
+        replacements = []
+        source_text = text
+        if glossary:
+            with profiling.span("glossary"):
+                source_text, replacements = glossary.protect(text, request.target_lang)
+        
         # 进行翻译
-        loop = asyncio.get_running_loop()
-        blocking_task = functools.partial(_translate_blocking, model, tokenizer, text)
-        translated_text = await loop.run_in_executor(None, blocking_task)
+        start_time = time.perf_counter()
+        # inference 包含排队等待，与工作线程中各阶段之和的差即为排队耗时
+        with profiling.span("inference"):
+            translated_text = await scheduler.submit(
+                priority, _translate_blocking, model, tokenizer, source_text, request.profile, cancel_event,
+                session_id=request.session_id
+            )
+        # 生成结束后、返回之前才到达的新修订同样会取代本次结果
+        if translated_text is None or (cancel_event is not None and cancel_event.is_set()):
+            return superseded_result(request)
+        if glossary:
+            with profiling.span("glossary"):
+                translated_text = glossary.restore(translated_text, replacements)
+        record_profile_metrics(request.profile, (time.perf_counter() - start_time) * 1000)
         
         # 计算置信度 (简化版本)
         confidence = min(1.0, len(translated_text) / max(1, len(text)) * 0.8 + 0.2)
@@ -185,23 +553,91 @@ async def translate_text(request: TranslationRequest):
             translated_text=translated_text,
             source_lang=request.source_lang,
             target_lang=request.target_lang,
-            confidence=confidence
+            confidence=confidence,
+            profile=request.profile,
+            glossary_version=glossary_version
         )
         
         # 缓存结果
         translation_cache[cache_key] = result
         
         logger.info(f"Translation completed: '{translated_text}'")
-        return JSONResponse(content={"success": True, "result": result.dict()})
+        return result.dict()
         
+    except HTTPException:
+        raise
+    except SessionLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Translation error: {e}")
         raise HTTPException(status_code=500, detail=f"Translation failed: {str(e)}")
+    finally:
+        if segment_key is not None and active_segments.get(segment_key, (None, None))[1] is cancel_event:
+            del active_segments[segment_key]
+
+@app.put("/glossary/{tenant}")
+async def update_glossary(tenant: str, request: GlossaryRequest):
+    """
+    创建或替换租户术语表
+    
+    Args:
+        tenant: 租户 ID
+        request: 术语列表
+    
+    Returns:
+        新术语表的版本号和术语数
+    """
+    terms = [term.dict() for term in request.terms]
+    glossary = Glossary(tenant, terms)
+    glossaries[tenant] = glossary
+
+    try:
+        os.makedirs(GLOSSARY_DIR, exist_ok=True)
+        with open(os.path.join(GLOSSARY_DIR, f"{tenant}.json"), "w", encoding="utf-8") as f:
+            json.dump(glossary.terms, f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning(f"Failed to persist glossary for tenant {tenant}: {e}")
+
+    logger.info(f"Glossary for tenant {tenant} updated: {len(glossary.terms)} terms, version {glossary.version}")
+    return {"tenant": tenant, "version": glossary.version, "term_count": len(glossary.terms)}
+
+@app.get("/glossary/{tenant}")
+async def get_glossary(tenant: str):
+    """获取租户术语表"""
+    glossary = glossaries.get(tenant)
+    if glossary is None:
+        raise HTTPException(status_code=404, detail=f"No glossary for tenant {tenant}")
+    return {"tenant": tenant, "version": glossary.version, "terms": glossary.terms}
+
+@app.post("/translate")
+async def translate_text(request: TranslationRequest, http_request: Request):
+    """
+    翻译文本接口，走 interactive 调度队列
+    
+    Args:
+        request: 包含待翻译文本和语言方向的请求
+        http_request: 原始请求，未携带 session_id 时按客户端地址区分会话
+    
+    Returns:
+        翻译结果
+    """
+    if not request.session_id and http_request.client:
+        request.session_id = http_request.client.host
+    result = await run_translation(request, "interactive")
+    return JSONResponse(content={"success": True, "result": result})
 
 @app.post("/translate_batch")
-async def translate_batch(texts: List[str], source_lang: str, target_lang: str):
+async def translate_batch(
+    texts: List[str],
+    source_lang: str,
+    target_lang: str,
+    http_request: Request,
+    profile: str = "accurate",
+    session_id: Optional[str] = None,
+    tenant: Optional[str] = None
+):
     """
     批量翻译接口
     
@@ -209,21 +645,31 @@ async def translate_batch(texts: List[str], source_lang: str, target_lang: str):
         texts: 待翻译文本列表
         source_lang: 源语言
         target_lang: 目标语言
+        profile: 解码档位，批量任务默认使用束搜索的 accurate 档位
+        session_id: 会话 / 客户端 ID，未提供时按客户端地址区分
+        tenant: 租户 ID，用于选择术语表
+    
+    每条文本单独提交到 bulk 队列，实时请求可以在两条之间插队。
     
     Returns:
         翻译结果列表
     """
     try:
         results = []
+        if not session_id and http_request.client:
+            session_id = http_request.client.host
         
         for text in texts:
             request = TranslationRequest(
                 text=text,
                 source_lang=source_lang,
-                target_lang=target_lang
+                target_lang=target_lang,
+                profile=profile,
+                session_id=session_id,
+                tenant=tenant
             )
-            result = await translate_text(request)
-            results.append(result)
+            result = await run_translation(request, "bulk")
+            results.append({"success": True, "result": result})
         
         return {"translations": results}
         
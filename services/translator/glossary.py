@@ -0,0 +1,128 @@
+import hashlib
+import json
+import re
+from typing import Dict, List, Tuple
+
+# 占位符使用模型会原样复制的拉丁字母 + 数字，恢复时容忍模型插入的空格。
+# 原文中本来就有的 "TERM<n>" 也会被替换成占位符并原样恢复，不会与插入的占位符混淆
+PLACEHOLDER = "TERM{}"
+PLACEHOLDER_PATTERN = re.compile(r"TERM\s*(\d+)")
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and (char.isalnum() or char == "_")
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机。
+    构建一次后，单次扫描的耗时只与文本长度和命中数有关，与术语数量无关。
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(index)
+
+        # 按层次遍历构建失败指针，并把失败节点的输出合并进来
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+                queue.append(child)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """返回所有命中的 (起始位置, 结束位置, 模式下标)"""
+        matches = []
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in output[node]:
+                end = position + 1
+                matches.append((end - len(self.patterns[index]), end, index))
+        return matches
+
+
+class Glossary:
+    """
+    一个租户的术语表：翻译前把命中的术语替换成占位符，翻译后再替换成指定译文（未指定则保持原文）。
+    version 是术语内容的哈希，用作翻译缓存键的一部分。
+    """
+
+    def __init__(self, tenant: str, terms: List[Dict]):
+        self.tenant = tenant
+        self.terms = [term for term in terms if term.get("term")]
+        self.version = hashlib.sha1(
+            json.dumps(self.terms, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        self.matcher = AhoCorasick([term["term"] for term in self.terms])
+
+    def _select(self, text: str) -> List[Tuple[int, int, int]]:
+        """选取最左最长、互不重叠的命中，拉丁字母术语要求落在单词边界上"""
+        candidates = sorted(self.matcher.find_all(text), key=lambda match: (match[0], -(match[1] - match[0])))
+        selected = []
+        last_end = 0
+        for start, end, index in candidates:
+            if start < last_end:
+                continue
+            if _is_word_char(text[start]) and start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if _is_word_char(text[end - 1]) and end < len(text) and _is_word_char(text[end]):
+                continue
+            selected.append((start, end, index))
+            last_end = end
+        return selected
+
+    def protect(self, text: str, target_lang: str) -> Tuple[str, List[str]]:
+        """把术语替换成占位符，返回替换后的文本和每个占位符对应的译文"""
+        literals = [(match.start(), match.end(), match.group(0)) for match in PLACEHOLDER_PATTERN.finditer(text)]
+        spans = literals + [
+            (start, end, self.terms[index].get("translations", {}).get(target_lang, self.terms[index]["term"]))
+            for start, end, index in self._select(text)
+            if not any(start < literal_end and literal_start < end for literal_start, literal_end, _ in literals)
+        ]
+        if not spans:
+            return text, []
+
+        parts = []
+        replacements = []
+        last_end = 0
+        for start, end, replacement in sorted(spans):
+            parts.append(text[last_end:start])
+            parts.append(PLACEHOLDER.format(len(replacements)))
+            replacements.append(replacement)
+            last_end = end
+        parts.append(text[last_end:])
+        return "".join(parts), replacements
+
+    def restore(self, translated: str, replacements: List[str]) -> str:
+        """把译文中的占位符换回术语译文"""
+        if not replacements:
+            return translated
+
+        def substitute(match):
+            index = int(match.group(1))
+            return replacements[index] if index < len(replacements) else match.group(0)
+
+        return PLACEHOLDER_PATTERN.sub(substitute, translated)
@@ -0,0 +1,130 @@
+import contextlib
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+# 当前请求的 trace；没有 X-Trace 请求头时为 None，span() 直接返回空上下文
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+class Trace:
+    """一次请求的耗时分解，同名 span 累加耗时和次数（如逐 token 的 decode）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans: Dict[str, list] = {}
+
+    def add(self, name: str, elapsed_ms: float):
+        with self.lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += elapsed_ms
+            entry[1] += 1
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {name: {"ms": round(ms, 2), "count": count} for name, (ms, count) in self.spans.items()}
+
+    def header(self) -> str:
+        """编码为响应头，如 audio_decode=12.3,decode=301.2x24"""
+        parts = []
+        for name, span in self.as_dict().items():
+            suffix = f"x{span['count']}" if span["count"] > 1 else ""
+            parts.append(f"{name}={span['ms']}{suffix}")
+        return ",".join(parts)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def span(name: str):
+    """记录一个耗时片段，当前请求未开启 trace 时几乎没有开销"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return _Span(trace, name)
+
+
+def start_trace() -> Tuple[Trace, contextvars.Token]:
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def traced(fn, name: str):
+    """包装一个函数，在 trace 开启时记录其耗时"""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def add_module_timing(module, name: str):
+    """用 forward hook 记录 torch 模块每次前向的耗时，开始时间存放在线程局部变量中以支持多线程推理"""
+    local = threading.local()
+
+    def pre_hook(mod, inputs):
+        if _current_trace.get() is not None:
+            local.start = time.perf_counter()
+
+    def post_hook(mod, inputs, output):
+        trace = _current_trace.get()
+        start = getattr(local, "start", None)
+        if trace is not None and start is not None:
+            trace.add(name, (time.perf_counter() - start) * 1000)
+            local.start = None
+
+    module.register_forward_pre_hook(pre_hook)
+    module.register_forward_hook(post_hook)
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """
+    采样所有线程的调用栈，返回 flamegraph.pl / speedscope 可读取的折叠栈格式
+    （每行 "线程;外层函数;...;内层函数 次数"）。只在调用期间运行，不调用时没有任何开销。
+    """
+    counts = Counter()
+    sampler_id = threading.get_ident()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# 默认的优先级类别和权重：交互请求（实时字幕）获得 bulk 任务 4 倍的执行时间份额
+DEFAULT_WEIGHTS = {
+    "interactive": 4.0,
+    "bulk": 1.0,
+}
+
+# 未携带会话 ID 的请求归入同一个会话
+DEFAULT_SESSION = "anonymous"
+
+
+class SessionLimitExceeded(Exception):
+    """会话的在途任务数超过上限"""
+
+
+class _Job:
+    """一个排队中的推理任务，合并后可能对应多个等待者"""
+
+    __slots__ = ("task", "futures", "enqueued_at", "session_id", "context")
+
+    def __init__(self, task, future: asyncio.Future, session_id: str):
+        self.task = task
+        # 在提交方的上下文中执行任务，请求级的 contextvars（如 trace）才能传到工作线程
+        self.context = contextvars.copy_context()
+        self.futures = [future]
+        self.enqueued_at = time.perf_counter()
+        self.session_id = session_id
+
+
+class PriorityScheduler:
+    """
+    按优先级类别分队列、类别内按会话轮转的推理调度器。
+
+    每个类别维护一个虚拟时间，任务执行完后按 耗时 / 权重 累加；
+    空闲的工作线程总是从虚拟时间最小的非空类别中取任务（加权公平共享），
+    类别内部再按会话轮转，避免单个会话占满执行器。
+    调度只发生在任务边界，因此 bulk 任务需要拆分成分段 / 分批提交，
+    交互任务才能在两个分段之间插队。
+    所有调度状态只在事件循环线程中修改，不需要加锁。
+    """
+
+    def __init__(self, weights: Dict[str, float] = None, max_workers: int = 1, max_inflight_per_session: int = 4):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.max_workers = max_workers
+        self.max_inflight_per_session = max_inflight_per_session
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        # 类别 -> 会话 ID -> 该会话排队中的任务
+        self.queues = {name: OrderedDict() for name in self.weights}
+        self.virtual_time = {name: 0.0 for name in self.weights}
+        self.running = {name: 0 for name in self.weights}
+        self.inflight: Dict[str, int] = {}
+        self.clock = 0.0
+        self.stats = {
+            name: {"completed": 0, "coalesced": 0, "rejected": 0, "wait_ms": 0.0, "run_ms": 0.0}
+            for name in self.weights
+        }
+
+    async def submit(self, priority: str, fn, *args, session_id: str = None, coalesce=None, **kwargs):
+        """
+        提交一个阻塞任务并等待结果。
+
+        coalesce(queued_task, incoming_task) 可选：会话落后时尝试把新任务并入该会话最后一个
+        排队中的任务，返回合并后的任务或 None（无法合并）。被合并的较早等待者得到 None，
+        最新的等待者得到合并任务的结果。
+        """
+        if priority not in self.queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        session_id = session_id or DEFAULT_SESSION
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        task = functools.partial(fn, *args, **kwargs)
+        sessions = self.queues[priority]
+
+        pending = sessions.get(session_id)
+        if coalesce is not None and pending:
+            merged = coalesce(pending[-1].task, task)
+            if merged is not None:
+                pending[-1].task = merged
+                pending[-1].futures.append(future)
+                self.stats[priority]["coalesced"] += 1
+                return await future
+
+        if self.inflight.get(session_id, 0) >= self.max_inflight_per_session:
+            self.stats[priority]["rejected"] += 1
+            raise SessionLimitExceeded(
+                f"Session {session_id} already has {self.max_inflight_per_session} requests in flight"
+            )
+
+        # 空闲后重新活跃的类别不能用积攒的虚拟时间长期霸占执行器
+        if not sessions and not self.running[priority]:
+            self.virtual_time[priority] = max(self.virtual_time[priority], self.clock)
+
+        sessions.setdefault(session_id, deque()).append(_Job(task, future, session_id))
+        self.inflight[session_id] = self.inflight.get(session_id, 0) + 1
+        self._dispatch()
+        return await future
+
+    def _release(self, session_id: str):
+        self.inflight[session_id] -= 1
+        if not self.inflight[session_id]:
+            del self.inflight[session_id]
+
+    def _dispatch(self):
+        """在有空闲工作线程时，从虚拟时间最小的非空类别中按会话轮转取任务执行"""
+        while sum(self.running.values()) < self.max_workers:
+            candidates = [name for name, sessions in self.queues.items() if sessions]
+            if not candidates:
+                return
+            priority = min(candidates, key=lambda name: self.virtual_time[name])
+
+            sessions = self.queues[priority]
+            session_id, pending = sessions.popitem(last=False)
+            job = pending.popleft()
+            # 还有排队任务的会话移到队尾，实现会话间轮转
+            if pending:
+                sessions[session_id] = pending
+
+            # 调用方都已取消（如客户端断开），直接丢弃
+            if all(future.cancelled() for future in job.futures):
+                self._release(session_id)
+                continue
+            self.clock = self.virtual_time[priority]
+            self.running[priority] += 1
+            asyncio.ensure_future(self._run(priority, job))
+
+    async def _run(self, priority: str, job: _Job):
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self.executor, job.context.run, job.task)
+            for future in job.futures[:-1]:
+                if not future.done():
+                    future.set_result(None)
+            if not job.futures[-1].done():
+                job.futures[-1].set_result(result)
+        except Exception as e:
+            for future in job.futures:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.virtual_time[priority] += elapsed / self.weights[priority]
+            self.running[priority] -= 1
+            self._release(job.session_id)
+
+            stats = self.stats[priority]
+            stats["completed"] += 1
+            stats["wait_ms"] += (start_time - job.enqueued_at) * 1000
+            stats["run_ms"] += elapsed * 1000
+            self._dispatch()
+
+    def snapshot(self) -> Dict:
+        """返回各类别的队列长度、会话数和平均等待 / 执行耗时"""
+        return {
+            name: {
+                "queued": sum(len(pending) for pending in self.queues[name].values()),
+                "sessions": len(self.queues[name]),
+                "running": self.running[name],
+                "completed": stats["completed"],
+                "coalesced": stats["coalesced"],
+                "rejected": stats["rejected"],
+                "avg_wait_ms": round(stats["wait_ms"] / stats["completed"], 2) if stats["completed"] else 0.0,
+                "avg_run_ms": round(stats["run_ms"] / stats["completed"], 2) if stats["completed"] else 0.0,
+            }
+            for name, stats in self.stats.items()
+        }
@@ -1,15 +1,26 @@
 import os
-import whisper
+import json
+import hashlib
 import tempfile
 import numpy as np
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import Dict, List, Optional
 import uvicorn
 import logging
 import subprocess
 from contextlib import asynccontextmanager
 import asyncio
 import functools
+import math
+import time
+from scheduler import PriorityScheduler, SessionLimitExceeded
+import profiling
+
+# whisper / torch 导入较慢，延迟到后台加载模型时再导入，让 HTTP 服务先启动
+STARTUP_BEGIN = time.perf_counter()
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -18,15 +29,388 @@ logger = logging.getLogger(__name__)
 # 全局变量
 model = None
 
+MODEL_DIR = os.getenv("MODEL_DIR", "/app/models")
+# 首次启动时把官方 checkpoint 转为 safetensors，之后通过 mmap 零拷贝加载
+MMAP_WEIGHTS = os.getenv("MMAP_WEIGHTS", "true").lower() == "true"
+
+# 解码配置档位：realtime 单次贪心解码、不做温度回退；accurate 使用束搜索和完整回退
+# sample_tokens_per_second 用于按音频时长估算短窗口的最大生成 token 数，None 表示使用 Whisper 默认值。
+# 主要源语言是日语 / 中文：快语速约 6-8 字/秒，多语言分词器中一个汉字 / 假名常占 1-2 个 token，
+# 再加上每个分段的时间戳 token，估计峰值约 12-15 token/秒；上限留出余量，实际速率见 /metrics 的 token_rates
+DECODING_PROFILES = {
+    "realtime": {
+        "temperature": 0.0,
+        "beam_size": None,
+        "best_of": None,
+        "patience": None,
+        "sample_tokens_per_second": 18,
+    },
+    "balanced": {
+        "temperature": (0.0, 0.4, 0.8),
+        "beam_size": 2,
+        "best_of": 2,
+        "patience": 1.0,
+        "sample_tokens_per_second": 20,
+    },
+    "accurate": {
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "beam_size": 5,
+        "best_of": 5,
+        "patience": 1.0,
+        "sample_tokens_per_second": None,
+    },
+}
+
+# Whisper 单个 30 秒窗口的默认最大生成长度 (n_text_ctx // 2)
+MAX_SAMPLE_LEN = 224
+# 只对短于该时长的窗口缩放 sample_len；更长的窗口被截断时文本会被 seek 跳过而静默丢失，直接使用默认上限
+SAMPLE_LEN_SCALE_MAX_SECONDS = float(os.getenv("SAMPLE_LEN_SCALE_MAX_SECONDS", "10"))
+SAMPLE_RATE = 16000
+
+# 预热配置：启动后用这些时长（秒）的合成音频跑一遍模型，消除首个请求的延迟尖峰
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_DURATIONS = [float(d) for d in os.getenv("WARMUP_DURATIONS", "1,5,10").split(",") if d.strip()]
+WARMUP_PROFILES = [p.strip() for p in os.getenv("WARMUP_PROFILES", ",".join(DECODING_PROFILES)).split(",") if p.strip() in DECODING_PROFILES]
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() == "true"
+
+# 启动状态，/health 只有在模型加载并预热完成后才返回 ready
+startup_status = {
+    "stage": "loading",
+    "ready": False,
+    "load_ms": None,
+    "warmup_ms": None,
+    "time_to_healthy_ms": None,
+}
+
+# 租户术语表，更新时预先拼成 Whisper 的 initial_prompt，并持久化到 GLOSSARY_DIR
+# 格式与翻译服务相同，translations 字段在这里不使用
+GLOSSARY_DIR = os.getenv("GLOSSARY_DIR", "/app/glossaries")
+GLOSSARY_PROMPT_MAX_CHARS = int(os.getenv("GLOSSARY_PROMPT_MAX_CHARS", "300"))
+glossaries: Dict[str, Dict] = {}
+
+class GlossaryTerm(BaseModel):
+    term: str
+    translations: Dict[str, str] = {}
+
+class GlossaryRequest(BaseModel):
+    terms: List[GlossaryTerm]
+
+# 推理调度：实时片段走 interactive 队列，文件转录走 bulk 队列并按窗口切分，交互请求可在分段之间插队
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# 所有工作线程共用同一个模型，whisper 每次解码都会在共享的解码器上安装 kv-cache hook，
+# 并发解码会互相破坏缓存，因此在每个工作线程拥有独立模型之前只允许一个工作线程
+if INFERENCE_WORKERS > 1:
+    logger.warning(f"INFERENCE_WORKERS={INFERENCE_WORKERS} is not supported with a shared Whisper model, using 1")
+    INFERENCE_WORKERS = 1
+BULK_SEGMENT_SECONDS = int(os.getenv("BULK_SEGMENT_SECONDS", "30"))
+# 分段切点在每段末尾这段时间内选能量最低处，避免从单词中间切开
+BULK_SPLIT_SEARCH_SECONDS = float(os.getenv("BULK_SPLIT_SEARCH_SECONDS", "5"))
+# 每个会话（客户端）最多同时在途的请求数；会话落后时，排队中的实时片段会被合并成一个更长的窗口
+MAX_INFLIGHT_PER_SESSION = int(os.getenv("MAX_INFLIGHT_PER_SESSION", "4"))
+COALESCE_MAX_SECONDS = float(os.getenv("COALESCE_MAX_SECONDS", "30"))
+scheduler = PriorityScheduler(max_workers=INFERENCE_WORKERS, max_inflight_per_session=MAX_INFLIGHT_PER_SESSION)
+
+# 性能分析（默认关闭）：开启后提供 /debug/profile 采样接口，并为带 X-Trace 请求头的请求返回耗时分解；
+# 不带请求头的请求只多一次 contextvar 读取，可以在生产环境常开
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# 按档位统计的请求数和耗时
+profile_metrics = {name: {"requests": 0, "total_ms": 0.0, "max_ms": 0.0} for name in DECODING_PROFILES}
+# 按语言统计的实际生成速率（含时间戳 token），用于校准 sample_tokens_per_second
+token_rate_metrics: Dict[str, Dict] = {}
+
+def validate_profile(profile: str):
+    """检查解码档位是否存在"""
+    if profile not in DECODING_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown decoding profile: {profile}. Available: {list(DECODING_PROFILES.keys())}"
+        )
+
+def compile_glossary(terms: List[Dict]) -> Dict:
+    """把术语表拼成提示词，只取前 GLOSSARY_PROMPT_MAX_CHARS 个字符内能放下的术语"""
+    terms = [term for term in terms if term.get("term")]
+    prompt_terms = []
+    prompt_length = 0
+    for term in terms:
+        prompt_length += len(term["term"]) + 2
+        if prompt_length > GLOSSARY_PROMPT_MAX_CHARS:
+            break
+        prompt_terms.append(term["term"])
+    return {
+        "terms": terms,
+        "version": hashlib.sha1(json.dumps(terms, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12],
+        "prompt": ", ".join(prompt_terms) or None,
+    }
+
+def get_glossary_prompt(tenant: Optional[str]) -> Optional[str]:
+    """返回租户术语表对应的 initial_prompt"""
+    glossary = glossaries.get(tenant) if tenant else None
+    return glossary["prompt"] if glossary else None
+
+def load_glossaries():
+    """从 GLOSSARY_DIR 加载已保存的租户术语表"""
+    if not os.path.isdir(GLOSSARY_DIR):
+        return
+    for filename in os.listdir(GLOSSARY_DIR):
+        if not filename.endswith(".json"):
+            continue
+        tenant = filename[:-len(".json")]
+        try:
+            with open(os.path.join(GLOSSARY_DIR, filename), encoding="utf-8") as f:
+                glossaries[tenant] = compile_glossary(json.load(f))
+            logger.info(f"Loaded glossary for tenant {tenant}: {len(glossaries[tenant]['terms'])} terms")
+        except Exception as e:
+            logger.error(f"Failed to load glossary {filename}: {e}")
+
+def build_transcribe_options(language: str, profile: str, duration: float, initial_prompt: Optional[str] = None):
+    """根据解码档位和音频时长构建 whisper.transcribe 参数，initial_prompt 为术语提示"""
+    validate_profile(profile)
+    settings = DECODING_PROFILES[profile]
+
+    options = {
+        "language": language if language != 'auto' else None,
+        "fp16": False,
+        "verbose": True,
+        "no_speech_threshold": 0.6,
+        "logprob_threshold": -1.0,
+        "compression_ratio_threshold": 2.4,
+        "condition_on_previous_text": False,
+        "temperature": settings["temperature"],
+        "initial_prompt": initial_prompt,
+    }
+    for key in ("beam_size", "best_of", "patience"):
+        if settings[key] is not None:
+            options[key] = settings[key]
+
+    # 按时长缩放短片段的 sample_len，避免短片段在幻觉循环中跑满 224 个 token
+    if settings["sample_tokens_per_second"] is not None and duration < SAMPLE_LEN_SCALE_MAX_SECONDS:
+        sample_len = math.ceil(duration * settings["sample_tokens_per_second"]) + 16
+        options["sample_len"] = min(MAX_SAMPLE_LEN, sample_len)
+
+    return options
+
+def record_profile_metrics(profile: str, elapsed_ms: float):
+    """记录解码档位的耗时统计"""
+    stats = profile_metrics[profile]
+    stats["requests"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+def record_token_rate(result: Dict, duration: float, sample_len: Optional[int]):
+    """记录一个窗口的生成 token 数；达到 sample_len 的窗口可能被截断，单独计数并告警"""
+    tokens = sum(len(segment.get("tokens", [])) for segment in result.get("segments", []))
+    stats = token_rate_metrics.setdefault(
+        result.get("language") or "unknown",
+        {"windows": 0, "audio_seconds": 0.0, "tokens": 0, "max_tokens_per_second": 0.0, "hit_sample_len": 0}
+    )
+    stats["windows"] += 1
+    stats["audio_seconds"] += duration
+    stats["tokens"] += tokens
+    if duration > 0:
+        stats["max_tokens_per_second"] = max(stats["max_tokens_per_second"], tokens / duration)
+    if sample_len is not None and tokens >= sample_len - 1:
+        stats["hit_sample_len"] += 1
+        logger.warning(f"Window of {duration:.1f}s generated {tokens} tokens, reaching sample_len={sample_len}; text may be truncated")
+
+def get_session_id(session_id: str, request: Request) -> str:
+    """未携带会话 ID 的请求按客户端地址区分"""
+    if session_id:
+        return session_id
+    return request.client.host if request.client else None
+
+def split_at_silence(audio_np, max_seconds: float, search_seconds: float = BULK_SPLIT_SEARCH_SECONDS):
+    """把长音频切成不超过 max_seconds 的分段，切点选在每段末尾 search_seconds 内能量最低的 30ms 帧"""
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    frame_samples = SAMPLE_RATE * 30 // 1000
+    segments = []
+    start = 0
+    while len(audio_np) - start > max_samples:
+        end = start + max_samples
+        search_start = max(start + frame_samples, end - int(search_seconds * SAMPLE_RATE))
+        frame_count = (end - search_start) // frame_samples
+        cut = end
+        if frame_count > 0:
+            frames = audio_np[search_start:search_start + frame_count * frame_samples].reshape(frame_count, frame_samples)
+            quietest = int(np.argmin(np.square(frames).mean(axis=1)))
+            cut = search_start + quietest * frame_samples + frame_samples // 2
+        segments.append(audio_np[start:cut])
+        start = cut
+    segments.append(audio_np[start:])
+    return segments
+
+def _coalesce_audio(queued, incoming):
+    """把同一会话排队中的音频片段和新片段拼接成一个更长的窗口，超过 COALESCE_MAX_SECONDS 时不合并"""
+    if queued.args[1:] != incoming.args[1:]:
+        return None
+    merged_audio = np.concatenate([queued.args[0], incoming.args[0]])
+    if len(merged_audio) > COALESCE_MAX_SECONDS * SAMPLE_RATE:
+        return None
+    return functools.partial(queued.func, merged_audio, *queued.args[1:])
+
+async def iter_transcription(audio_np, language: str, profile: str, priority: str, session_id: str = None, initial_prompt: Optional[str] = None):
+    """
+    通过调度器执行转录，每个窗口完成后立即产出结果，调用方可以据此提前开始翻译。
+    bulk 任务在静音处切成不超过 BULK_SEGMENT_SECONDS 的分段后逐段提交；interactive 任务在会话落后时会与排队中的片段合并，
+    被合并的较早请求产出空文本并带 coalesced 标记，合并后的完整文本由最新的请求产出。
+    """
+    validate_profile(profile)
+    if priority == "bulk":
+        segments = split_at_silence(audio_np, BULK_SEGMENT_SECONDS)
+        coalesce = None
+    else:
+        segments = [audio_np]
+        coalesce = _coalesce_audio
+
+    detected_language = None
+    start_time = time.perf_counter()
+    for index, segment in enumerate(segments):
+        # 后续分段沿用第一段检测到的语言，避免每段重复做语言检测
+        try:
+            # inference 包含排队等待，与工作线程中的 transcribe 之差即为排队耗时
+            with profiling.span("inference"):
+                result = await scheduler.submit(
+                    priority, _transcribe_window_blocking, segment, detected_language or language, profile, initial_prompt,
+                    session_id=session_id, coalesce=coalesce
+                )
+        except SessionLimitExceeded as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        if result is None:
+            logger.info(f"Chunk from session {session_id} was coalesced into a later request")
+            yield {"segment_id": index, "text": "", "language": language, "coalesced": True, "final": True}
+            return
+        detected_language = detected_language or result.get("language")
+        yield {
+            "segment_id": index,
+            "text": result["text"],
+            "language": detected_language or "unknown",
+            "coalesced": False,
+            "final": index == len(segments) - 1,
+        }
+    record_profile_metrics(profile, (time.perf_counter() - start_time) * 1000)
+
+async def run_transcription(audio_np, language: str, profile: str, priority: str, session_id: str = None, initial_prompt: Optional[str] = None):
+    """执行转录并拼接所有窗口的文本"""
+    texts = []
+    result_language = "unknown"
+    async for part in iter_transcription(audio_np, language, profile, priority, session_id, initial_prompt):
+        if part["coalesced"]:
+            return {"text": "", "language": part["language"], "coalesced": True}
+        texts.append(part["text"])
+        result_language = part["language"]
+
+    return {"text": "".join(texts), "language": result_language, "coalesced": False}
+
+async def stream_transcription(parts, trace=None):
+    """
+    把逐窗口的转录结果编码成 NDJSON，出错时以一行 error 结束。
+    响应头在推理开始前就已发出，请求带 X-Trace 时完整的耗时分解放在最后一行的 trace 字段中。
+    """
+    def encode(payload):
+        if payload.get("final") and trace is not None:
+            payload = {**payload, "trace": trace.as_dict()}
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    try:
+        async for part in parts:
+            yield encode(part)
+    except HTTPException as e:
+        yield encode({"error": e.detail, "status_code": e.status_code, "final": True})
+    except Exception as e:
+        logger.error(f"Streaming transcription error: {e}")
+        yield encode({"error": str(e), "status_code": 500, "final": True})
+
+def _transcribe_window_blocking(audio, language: str, profile: str, initial_prompt: Optional[str]):
+    """按实际（可能已合并的）音频时长构建参数后执行转录"""
+    duration = len(audio) / SAMPLE_RATE
+    transcribe_options = build_transcribe_options(language, profile, duration, initial_prompt)
+    result = _transcribe_blocking(model, audio, **transcribe_options)
+    record_token_rate(result, duration, transcribe_options.get("sample_len"))
+    return result
+
 def _transcribe_blocking(model, audio, **options):
     """
     在独立的执行器中运行阻塞的 whisper.transcribe 函数。
     """
+    import whisper
+
     logger.info(f"Starting transcription in executor with options: {options}")
-    result = whisper.transcribe(model, audio, **options)
+    with profiling.span("transcribe"):
+        result = whisper.transcribe(model, audio, **options)
     logger.info("Transcription call finished in executor.")
     return result
 
+def _safetensors_paths(model_size: str):
+    """返回转换后的权重文件和模型结构文件路径"""
+    base = os.path.join(MODEL_DIR, f"whisper-{os.path.basename(model_size)}")
+    return f"{base}.safetensors", f"{base}.dims.json"
+
+def save_whisper_safetensors(whisper_model, model_size: str):
+    """把模型权重和结构保存为 safetensors，先写临时文件再替换，避免中途退出留下不完整的权重"""
+    from safetensors.torch import save_file
+
+    weights_path, dims_path = _safetensors_paths(model_size)
+    logger.info(f"Converting Whisper checkpoint to {weights_path}")
+    state = {name: tensor.contiguous() for name, tensor in whisper_model.state_dict().items()}
+    save_file(state, f"{weights_path}.tmp")
+    with open(f"{dims_path}.tmp", "w") as f:
+        json.dump(whisper_model.dims.__dict__, f)
+    os.replace(f"{weights_path}.tmp", weights_path)
+    os.replace(f"{dims_path}.tmp", dims_path)
+
+def convert_whisper_checkpoint(model_size: str):
+    """用官方加载器读取 checkpoint，并保存为 safetensors 供后续启动 mmap 加载"""
+    import whisper
+
+    whisper_model = whisper.load_model(model_size, device="cpu", download_root=MODEL_DIR)
+    try:
+        save_whisper_safetensors(whisper_model, model_size)
+    except Exception as e:
+        # MODEL_DIR 只读或空间不足时照常使用已加载的模型，下次启动仍走官方加载器
+        logger.warning(f"Failed to save safetensors weights, serving the in-memory model: {e}")
+        for path in (f"{path}.tmp" for path in _safetensors_paths(model_size)):
+            if os.path.exists(path):
+                os.unlink(path)
+    return whisper_model
+
+def load_mmap_whisper_model(model_size: str):
+    """在 meta 设备上构建编码器和解码器，再直接挂载 mmap 的 safetensors 权重，跳过随机初始化和整份拷贝"""
+    import torch
+    import whisper
+    from whisper.model import AudioEncoder, ModelDimensions, TextDecoder, Whisper
+    from safetensors.torch import load_file
+
+    weights_path, dims_path = _safetensors_paths(model_size)
+    with open(dims_path) as f:
+        dims = ModelDimensions(**json.load(f))
+
+    # Whisper.__init__ 会对 alignment_heads 调用 to_sparse()，meta 张量不支持，
+    # 因此跳过它，只把编码器和解码器放在 meta 设备上构建，其余 buffer 在下面于 CPU 上生成
+    whisper_model = Whisper.__new__(Whisper)
+    torch.nn.Module.__init__(whisper_model)
+    whisper_model.dims = dims
+    with torch.device("meta"):
+        whisper_model.encoder = AudioEncoder(
+            dims.n_mels, dims.n_audio_ctx, dims.n_audio_state, dims.n_audio_head, dims.n_audio_layer
+        )
+        whisper_model.decoder = TextDecoder(
+            dims.n_vocab, dims.n_text_ctx, dims.n_text_state, dims.n_text_head, dims.n_text_layer
+        )
+    whisper_model.load_state_dict(load_file(weights_path), assign=True)
+
+    # 非持久化的 buffer 不在权重文件中，需要重新生成
+    mask = torch.empty(dims.n_text_ctx, dims.n_text_ctx).fill_(-np.inf).triu_(1)
+    whisper_model.decoder.register_buffer("mask", mask, persistent=False)
+    alignment_heads = getattr(whisper, "_ALIGNMENT_HEADS", {}).get(model_size)
+    if alignment_heads is not None:
+        whisper_model.set_alignment_heads(alignment_heads)
+    else:
+        all_heads = torch.zeros(dims.n_text_layer, dims.n_text_head, dtype=torch.bool)
+        all_heads[dims.n_text_layer // 2:] = True
+        whisper_model.register_buffer("alignment_heads", all_heads.to_sparse(), persistent=False)
+    return whisper_model
+
 def load_whisper_model():
     """加载 Whisper 模型"""
     global model
@@ -36,17 +420,101 @@ def load_whisper_model():
     logger.info(f"Loading Whisper model: {model_size} on {device}")
     
     try:
-        model = whisper.load_model(model_size, device=device, download_root="/app/models")
+        if not MMAP_WEIGHTS:
+            import whisper
+
+            model = whisper.load_model(model_size, device=device, download_root=MODEL_DIR)
+        elif all(os.path.exists(path) for path in _safetensors_paths(model_size)):
+            model = load_mmap_whisper_model(model_size).to(device)
+        else:
+            model = convert_whisper_checkpoint(model_size).to(device)
         logger.info("Whisper model loaded successfully")
     except Exception as e:
         logger.error(f"Failed to load Whisper model: {e}")
         raise
 
+def compile_whisper_model():
+    """可选：用 torch.compile 编译编码器，失败时退回 eager 模式"""
+    import torch
+
+    try:
+        logger.info("Compiling Whisper encoder with torch.compile...")
+        model.encoder = torch.compile(model.encoder)
+        logger.info("Whisper encoder compiled")
+    except Exception as e:
+        logger.warning(f"torch.compile failed, falling back to eager mode: {e}")
+
+def instrument_whisper_model():
+    """
+    为 X-Trace 插桩 whisper.transcribe 内部的各阶段：mel 频谱、编码器前向、解码器前向（逐 token 累加）。
+    whisper.transcribe 没有提供回调，mel 通过替换 whisper.transcribe 模块中引用的 log_mel_spectrogram 计时，
+    编码 / 解码通过 forward hook 计时；未开启 trace 的请求只多一次 contextvar 读取。
+    """
+    import sys
+    import whisper
+
+    transcribe_module = sys.modules[whisper.transcribe.__module__]
+    transcribe_module.log_mel_spectrogram = profiling.traced(transcribe_module.log_mel_spectrogram, "mel")
+    profiling.add_module_timing(model.encoder, "encode")
+    profiling.add_module_timing(model.decoder, "decode")
+    logger.info("Whisper model instrumented for per-request tracing")
+
+def _warmup_blocking():
+    """
+    用合成音频按常见时长和每个解码档位跑一遍转录，
+    提前完成内存分配器扩容、算子选择和（可选的）编译。
+    """
+    import whisper
+
+    rng = np.random.default_rng(0)
+    for duration in WARMUP_DURATIONS:
+        audio = (rng.standard_normal(int(duration * SAMPLE_RATE)) * 0.01).astype(np.float32)
+        for profile in WARMUP_PROFILES:
+            options = build_transcribe_options("auto", profile, duration)
+            options["verbose"] = None
+            start_time = time.perf_counter()
+            whisper.transcribe(model, audio, **options)
+            logger.info(f"Warm-up {duration}s/{profile} took {(time.perf_counter() - start_time) * 1000:.0f} ms")
+
+async def start_model():
+    """在后台加载并预热模型，完成后将服务标记为 ready"""
+    loop = asyncio.get_running_loop()
+
+    start_time = time.perf_counter()
+    try:
+        await loop.run_in_executor(None, load_whisper_model)
+    except Exception:
+        startup_status["stage"] = "failed"
+        return
+    if TORCH_COMPILE:
+        compile_whisper_model()
+    if PROFILING_ENABLED:
+        instrument_whisper_model()
+    startup_status["load_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+
+    startup_status["stage"] = "warming_up"
+    start_time = time.perf_counter()
+    if WARMUP_ENABLED:
+        logger.info(f"Warming up Whisper model for durations: {WARMUP_DURATIONS}")
+        try:
+            await loop.run_in_executor(None, _warmup_blocking)
+        except Exception as e:
+            logger.warning(f"Warm-up failed, serving without it: {e}")
+    startup_status["warmup_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+
+    startup_status["time_to_healthy_ms"] = round((time.perf_counter() - STARTUP_BEGIN) * 1000, 2)
+    startup_status["stage"] = "ready"
+    startup_status["ready"] = True
+    logger.info(f"Whisper service ready in {startup_status['time_to_healthy_ms']} ms "
+                f"(load {startup_status['load_ms']} ms, warm-up {startup_status['warmup_ms']} ms)")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load the model
-    load_whisper_model()
+    load_glossaries()
+    # Load the model in the background so /health can answer while loading
+    startup_task = asyncio.create_task(start_model())
     yield
+    startup_task.cancel()
     # Clean up the model
     global model
     model = None
@@ -63,14 +531,120 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if PROFILING_ENABLED:
+    @app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        """
+        带 X-Trace 请求头的请求在响应头 X-Trace 中返回各阶段耗时（毫秒，xN 表示累计 N 次）。
+        流式响应的响应头只包含推理前的阶段，完整分解见 stream_transcription 的最后一行。
+        """
+        if not request.headers.get("X-Trace"):
+            return await call_next(request)
+        trace, token = profiling.start_trace()
+        try:
+            with profiling.span("total"):
+                response = await call_next(request)
+        finally:
+            profiling.end_trace(token)
+        response.headers["X-Trace"] = trace.header()
+        return response
+
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    return {
-        "status": "healthy",
+    """健康检查端点，模型加载并预热完成前返回 503"""
+    ready = model is not None and startup_status["ready"]
+    content = {
+        "status": startup_status["stage"],
         "model_loaded": model is not None,
+        "load_ms": startup_status["load_ms"],
+        "warmup_ms": startup_status["warmup_ms"],
+        "time_to_healthy_ms": startup_status["time_to_healthy_ms"],
         "service": "whisper"
     }
+    if not ready:
+        return JSONResponse(status_code=503, content=content)
+    return content
+
+def get_process_stats():
+    """进程常驻内存和临时文件数量，供长时间压测检测泄漏"""
+    rss_mb = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 2)
+    except (OSError, ValueError):
+        pass
+    return {
+        "rss_mb": rss_mb,
+        "temp_files": len(os.listdir(tempfile.gettempdir())),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """按解码档位汇总的转录耗时"""
+    return {
+        "service": "whisper",
+        "profiles": {
+            name: {
+                "requests": stats["requests"],
+                "avg_ms": round(stats["total_ms"] / stats["requests"], 2) if stats["requests"] else 0.0,
+                "max_ms": round(stats["max_ms"], 2),
+            }
+            for name, stats in profile_metrics.items()
+        },
+        "token_rates": {
+            language: {
+                "windows": stats["windows"],
+                "avg_tokens_per_second": round(stats["tokens"] / stats["audio_seconds"], 2) if stats["audio_seconds"] else 0.0,
+                "max_tokens_per_second": round(stats["max_tokens_per_second"], 2),
+                "hit_sample_len": stats["hit_sample_len"],
+            }
+            for language, stats in token_rate_metrics.items()
+        },
+        "scheduler": scheduler.snapshot(),
+        "process": {
+            **get_process_stats(),
+            "glossaries": len(glossaries),
+        }
+    }
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0):
+    """
+    采样 seconds 秒内所有线程的调用栈，返回折叠栈文本，可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+    需要设置 PROFILING_ENABLED=true。
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled. Set PROFILING_ENABLED=true to enable it.")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}]")
+    # 采样线程放在默认执行器中，不占用推理工作线程
+    loop = asyncio.get_running_loop()
+    stacks = await loop.run_in_executor(None, profiling.sample_stacks, seconds)
+    return PlainTextResponse(stacks)
+
+@app.put("/glossary/{tenant}")
+async def update_glossary(tenant: str, request: GlossaryRequest):
+    """创建或替换租户术语表，术语会作为提示词传给 Whisper"""
+    glossary = compile_glossary([term.dict() for term in request.terms])
+    glossaries[tenant] = glossary
+
+    try:
+        os.makedirs(GLOSSARY_DIR, exist_ok=True)
+        with open(os.path.join(GLOSSARY_DIR, f"{tenant}.json"), "w", encoding="utf-8") as f:
+            json.dump(glossary["terms"], f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning(f"Failed to persist glossary for tenant {tenant}: {e}")
+
+    logger.info(f"Glossary for tenant {tenant} updated: {len(glossary['terms'])} terms, version {glossary['version']}")
+    return {"tenant": tenant, "version": glossary["version"], "term_count": len(glossary["terms"]), "prompt": glossary["prompt"]}
+
+@app.get("/glossary/{tenant}")
+async def get_glossary(tenant: str):
+    """获取租户术语表"""
+    glossary = glossaries.get(tenant)
+    if glossary is None:
+        raise HTTPException(status_code=404, detail=f"No glossary for tenant {tenant}")
+    return {"tenant": tenant, **glossary}
 
 def convert_audio_to_wav(input_data, is_webm):
     """使用 ffmpeg 将内存中的音频数据转换为 wav 格式"""
@@ -120,6 +694,48 @@ def convert_audio_to_wav(input_data, is_webm):
         logger.error(f"Audio conversion error: {e}")
         return None
 
+def load_audio_bytes(input_data: bytes, is_webm: bool):
+    """用 ffmpeg 管道把内存中的音频直接解码为 16kHz 单声道 float32 数组，不落盘"""
+    cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+    if is_webm or input_data.startswith(b'\x1a\x45\xdf\xa3'):
+        cmd.extend(['-f', 'webm'])
+    cmd.extend([
+        '-i', 'pipe:0',
+        '-ar', str(SAMPLE_RATE),
+        '-ac', '1',
+        '-f', 's16le',
+        'pipe:1'
+    ])
+
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    pcm_data, stderr = process.communicate(input=input_data)
+    if process.returncode != 0:
+        logger.error(f"FFmpeg decoding failed: {stderr.decode()}")
+        return None
+    return np.frombuffer(pcm_data, np.int16).astype(np.float32) / 32768.0
+
+def trim_silence(audio_np, aggressiveness: int = 2, padding_ms: int = 300):
+    """
+    用 webrtcvad 去掉首尾静音，没有检测到语音时返回空数组，调用方可以直接跳过识别。
+    """
+    import webrtcvad
+
+    vad = webrtcvad.Vad(aggressiveness)
+    frame_samples = SAMPLE_RATE * 30 // 1000
+    pcm = (np.clip(audio_np, -1.0, 1.0) * 32767).astype(np.int16)
+
+    speech_frames = [
+        index for index in range(len(pcm) // frame_samples)
+        if vad.is_speech(pcm[index * frame_samples:(index + 1) * frame_samples].tobytes(), SAMPLE_RATE)
+    ]
+    if not speech_frames:
+        return audio_np[:0]
+
+    padding = SAMPLE_RATE * padding_ms // 1000
+    start = max(0, speech_frames[0] * frame_samples - padding)
+    end = min(len(audio_np), (speech_frames[-1] + 1) * frame_samples + padding)
+    return audio_np[start:end]
+
 def validate_audio_data(data):
     """验证音频数据的基本完整性"""
     if len(data) < 100:
@@ -134,11 +750,11 @@ def validate_audio_data(data):
     logger.warning("Audio data validation failed, but proceeding anyway")
     return False
 
-async def transcribe_audio_data(data: bytes, language: str):
+async def transcribe_audio_data(data: bytes, language: str, profile: str = "realtime", priority: str = "interactive", session_id: str = None, tenant: str = None):
     """转录音频数据"""
-    global model
-    if model is None:
-        raise HTTPException(status_code=503, detail="Whisper model is not loaded yet.")
+    # 预热期间模型已加载但仍在执行器中解码，并发解码会互相破坏解码器上的 kv-cache hook
+    if not startup_status["ready"]:
+        raise HTTPException(status_code=503, detail="Whisper model is not ready yet.")
 
     if len(data) < 100:
         logger.error("Audio data is too small to be valid.")
@@ -148,7 +764,8 @@ async def transcribe_audio_data(data: bytes, language: str):
     temp_file_path = None
     try:
         # 强制将音频转换为WAV格式
-        wav_data = convert_audio_to_wav(data, False)
+        with profiling.span("audio_convert"):
+            wav_data = convert_audio_to_wav(data, False)
         if not wav_data:
             raise HTTPException(status_code=400, detail="Audio conversion failed.")
 
@@ -160,33 +777,20 @@ async def transcribe_audio_data(data: bytes, language: str):
         logger.info(f"Created temp file: {temp_file_path}")
 
         # 从临时文件加载音频
+        import whisper
+
         logger.info("Loading audio from temp file...")
-        audio_np = whisper.load_audio(temp_file_path)
+        with profiling.span("audio_load"):
+            audio_np = whisper.load_audio(temp_file_path)
         logger.info(f"Audio loaded successfully, shape: {audio_np.shape}")
 
         # 执行转录
         logger.info("Starting transcription...")
-        
-        # 添加超时处理和更简单的参数
-        transcribe_options = {
-            "language": language if language != 'auto' else None,
-            "fp16": False,
-            "verbose": True,
-            "no_speech_threshold": 0.6,
-            "logprob_threshold": -1.0,
-            "compression_ratio_threshold": 2.4,
-            "condition_on_previous_text": False
-        }
-        
-        logger.info(f"Starting transcription with options: {transcribe_options}")
-        
-        loop = asyncio.get_running_loop()
-        blocking_task = functools.partial(_transcribe_blocking, model, audio_np, **transcribe_options)
-        result = await loop.run_in_executor(None, blocking_task)
+        result = await run_transcription(audio_np, language, profile, priority, session_id, get_glossary_prompt(tenant))
 
         logger.info("Transcription call finished.")
         logger.info(f"Transcription completed successfully. Text: \'{result['text'][:100]}...\'")
-        return {"text": result["text"], "language": result.get("language", "unknown")}
+        return {"text": result["text"], "language": result["language"], "profile": profile, "coalesced": result["coalesced"]}
 
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -203,13 +807,21 @@ async def transcribe_audio_data(data: bytes, language: str):
                 logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
 
 @app.post("/transcribe_realtime")
-async def transcribe_realtime(file: UploadFile = File(...), language: str = Form("auto")):
-    """实时转录音频文件"""
+async def transcribe_realtime(
+    request: Request,
+    file: UploadFile = File(...),
+    language: str = Form("auto"),
+    profile: str = Form("realtime"),
+    session_id: str = Form(None), # 会话 / 客户端 ID，用于会话间公平调度
+    tenant: str = Form(None) # 租户 ID，用于选择术语表
+):
+    """实时转录音频文件，默认使用单次贪心解码的 realtime 档位"""
     try:
         audio_data = await file.read()
-        logger.info(f"Received real-time audio chunk. Size: {len(audio_data)}, Language: {language}")
+        session_id = get_session_id(session_id, request)
+        logger.info(f"Received real-time audio chunk. Size: {len(audio_data)}, Language: {language}, Profile: {profile}, Session: {session_id}")
         
-        transcription_result = await transcribe_audio_data(audio_data, language)
+        transcription_result = await transcribe_audio_data(audio_data, language, profile, "interactive", session_id, tenant)
         return transcription_result
 
     except Exception as e:
@@ -221,15 +833,28 @@ async def transcribe_realtime(file: UploadFile = File(...), language: str = Form
 
 @app.post("/transcribe")
 async def transcribe_audio(
+    request: Request,
     file: UploadFile = File(...),
     language: str = Form("auto"),
-    realtime: str = Form("false") # 新增参数，用于区分实时流
+    realtime: str = Form("false"), # 新增参数，用于区分实时流
+    profile: str = Form(None), # 解码档位：realtime / balanced / accurate，默认实时流用 realtime、文件用 balanced
+    session_id: str = Form(None), # 会话 / 客户端 ID，用于会话间公平调度
+    tenant: str = Form(None), # 租户 ID，用于选择术语表
+    stream: str = Form("false") # 为 true 时以 NDJSON 逐窗口返回部分结果，适用于多窗口的长音频文件
 ):
     """
     接收音频文件，进行语音识别并返回结果。
     新增 realtime 参数来明确告知这是前端实时录音流。
+    profile 参数选择解码档位，实时流默认使用贪心解码的 realtime 档位，文件转录默认使用束搜索的 balanced 档位。
+    stream 为 true 时每个窗口转录完成后立即返回一行结果，调用方可以边转录边翻译；
+    实时片段只有一个窗口，流式返回没有收益。
     """
-    logger.info(f"Received audio file for transcription. Size: {file.size}, Language: {language}, Realtime: {realtime}")
+    session_id = get_session_id(session_id, request)
+    profile = profile or ("realtime" if realtime.lower() == 'true' else "balanced")
+    logger.info(f"Received audio file for transcription. Size: {file.size}, Language: {language}, Realtime: {realtime}, Profile: {profile}, Session: {session_id}")
+
+    if not startup_status["ready"]:
+        raise HTTPException(status_code=503, detail="Whisper model is not ready yet.")
 
     # 读取上传的音频文件内容
     contents = await file.read()
@@ -238,7 +863,8 @@ async def transcribe_audio(
     is_webm = realtime.lower() == 'true'
 
     # 转换音频为 WAV 格式
-    wav_data = convert_audio_to_wav(contents, is_webm)
+    with profiling.span("audio_convert"):
+        wav_data = convert_audio_to_wav(contents, is_webm)
     if wav_data is None:
         raise HTTPException(status_code=400, detail="Audio conversion failed.")
 
@@ -251,27 +877,20 @@ async def transcribe_audio(
         logger.info(f"Transcribing audio from temp WAV file: {temp_wav_file.name}")
 
         # 从临时文件加载音频
-        audio_np = whisper.load_audio(temp_wav_file.name)
+        import whisper
 
-        # 执行转录
+        with profiling.span("audio_load"):
+            audio_np = whisper.load_audio(temp_wav_file.name)
+
+        # 执行转录，前端实时录音流走 interactive 队列，其余文件上传走 bulk 队列
         logger.info("Starting transcription...")
-        
-        # 添加超时处理和更简单的参数
-        transcribe_options = {
-            "language": language if language != 'auto' else None,
-            "fp16": False,
-            "verbose": True,
-            "no_speech_threshold": 0.6,
-            "logprob_threshold": -1.0,
-            "compression_ratio_threshold": 2.4,
-            "condition_on_previous_text": False
-        }
-        
-        logger.info(f"Starting transcription with options: {transcribe_options}")
-        
-        loop = asyncio.get_running_loop()
-        blocking_task = functools.partial(_transcribe_blocking, model, audio_np, **transcribe_options)
-        result = await loop.run_in_executor(None, blocking_task)
+        priority = "interactive" if is_webm else "bulk"
+        if stream.lower() == 'true':
+            validate_profile(profile)
+            parts = iter_transcription(audio_np, language, profile, priority, session_id, get_glossary_prompt(tenant))
+            return StreamingResponse(stream_transcription(parts, profiling.current_trace()), media_type="application/x-ndjson")
+
+        result = await run_transcription(audio_np, language, profile, priority, session_id, get_glossary_prompt(tenant))
         
         logger.info("Transcription call finished.")
         logger.info(f"Transcription completed successfully. Text: \'{result['text'][:100]}...\'")
@@ -279,7 +898,9 @@ async def transcribe_audio(
         # 包装成统一的成功响应格式
         response_data = {
             "text": result["text"],
-            "language": result.get("language", "unknown")
+            "language": result["language"],
+            "profile": profile,
+            "coalesced": result["coalesced"]
         }
         return {"success": True, "result": response_data}
 
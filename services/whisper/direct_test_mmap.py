@@ -0,0 +1,57 @@
+import logging
+import sys
+import tempfile
+
+import numpy as np
+import torch
+from whisper.model import ModelDimensions, Whisper
+
+import app
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 与真实模型结构一致、但只有一层且宽度很小的模型，几秒内即可完成保存、加载和转录
+TINY_DIMS = ModelDimensions(
+    n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+    n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=2, n_text_layer=1,
+)
+
+def run_direct_test():
+    """
+    在容器内检查 safetensors 的保存 -> mmap 加载 -> 转录 往返流程，
+    覆盖服务第二次及之后启动时走的 load_mmap_whisper_model 分支。
+    """
+    model_size = "tiny-roundtrip"
+    with tempfile.TemporaryDirectory() as model_dir:
+        app.MODEL_DIR = model_dir
+
+        # --- 1. 保存 ---
+        original = Whisper(TINY_DIMS).eval()
+        app.save_whisper_safetensors(original, model_size)
+        logger.info(f"已保存到 {model_dir}")
+
+        # --- 2. mmap 加载 ---
+        loaded = app.load_mmap_whisper_model(model_size).eval()
+        meta_tensors = [name for name, tensor in list(loaded.named_parameters()) + list(loaded.named_buffers()) if tensor.is_meta]
+        if meta_tensors:
+            logger.error(f"❌ 加载后仍有 meta 张量: {meta_tensors}")
+            return False
+        original_state = original.state_dict()
+        for name, tensor in loaded.state_dict().items():
+            if not torch.equal(tensor, original_state[name]):
+                logger.error(f"❌ 权重不一致: {name}")
+                return False
+        logger.info("✅ mmap 加载的权重与原模型一致。")
+
+        # --- 3. 转录 ---
+        audio = (np.random.default_rng(0).standard_normal(app.SAMPLE_RATE) * 0.01).astype(np.float32)
+        options = app.build_transcribe_options("en", "realtime", 1.0)
+        options["verbose"] = None
+        result = app._transcribe_blocking(loaded, audio, **options)
+        logger.info(f"✅ 转录完成（随机权重，文本无意义）: {result['text'][:50]!r}")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if run_direct_test() else 1)